@@ -0,0 +1,38 @@
+import sys
+import types
+
+import psycopg2.extras  # Loaded by create_engine in the real config.database; the DAL relies on it
+from psycopg2 import pool
+
+# Shared setup for the backend benchmarks. They take the DSN of a scratch database on
+# the command line and never touch config.database's DATABASE_URL: use_database()
+# registers a stand-in config.database backed by a pool on that DSN, so the DAL
+# classes imported afterwards run against the benchmark database. The scripts drop
+# and recreate sensorsdata there.
+
+MIGRATIONS_DIR = "migrations"
+
+
+def use_database(dsn):
+    """Point config.database at dsn; call before importing anything from dal/."""
+    if "config.database" in sys.modules:
+        raise RuntimeError("config.database is already imported; call use_database() first")
+    connections = pool.SimpleConnectionPool(1, 8, dsn)
+    module = types.ModuleType("config.database")
+    module.DATABASE_URL = dsn
+    module.get_connection = connections.getconn
+    module.release_connection = connections.putconn
+    sys.modules["config.database"] = module
+    return connections
+
+
+def migration_sql(name):
+    with open(f"{MIGRATIONS_DIR}/{name}") as f:
+        return f.read()
+
+
+def reset_sensorsdata(cursor):
+    """An empty, unpartitioned sensorsdata keyed as after migration 001."""
+    cursor.execute("DROP TABLE IF EXISTS sensorsdata, sensorsdata_legacy CASCADE;")
+    cursor.execute(migration_sql("000_baseline_schema.sql"))
+    cursor.execute(migration_sql("001_sensorsdata_device_reading_key.sql"))
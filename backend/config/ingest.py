@@ -0,0 +1,12 @@
+import os
+
+# Write-behind ingest (services/ingest_queue.py). When enabled, /api/send-data and
+# /api/send-current validate the batch, append it to a disk-backed log and answer 202;
+# a background flusher writes the log to Postgres in large cross-device transactions.
+# Requires a single server process, since the log directory is owned by one flusher.
+INGEST_WRITE_BEHIND = os.getenv("INGEST_WRITE_BEHIND", "0") == "1"
+INGEST_QUEUE_DIR = os.getenv("INGEST_QUEUE_DIR", "ingest_queue")
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "5000"))            # Rows per flush transaction
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))   # Max seconds a row waits to be flushed
+INGEST_SEGMENT_BYTES = int(os.getenv("INGEST_SEGMENT_BYTES", str(16 * 1024 * 1024)))  # Log file size before rolling
+INGEST_RETRY_BACKOFF = float(os.getenv("INGEST_RETRY_BACKOFF", "2.0"))     # Seconds to wait after a failed flush
@@ -0,0 +1,7 @@
+import os
+
+# Versioned schema migrations (migrations/migrate.py). Migrations are a deploy step run
+# while ingest is stopped: "python -m migrations.migrate". 002 and 003 lock sensorsdata
+# for minutes on a large table, so the app only applies them itself when this is set
+# to 1 (a fresh or small database); otherwise startup just reports pending ones.
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "0") == "1"
@@ -0,0 +1,12 @@
+import os
+
+# Time partitioning of sensorsdata (migrations/002_partition_sensorsdata.sql). A
+# maintenance thread (services/partition_service.py) keeps future partitions ready and,
+# when a retention is set, drops partitions that lie wholly before the cutoff. It does
+# nothing until the migration has been applied; ingest and queries work either way.
+PARTITION_MAINTENANCE = os.getenv("PARTITION_MAINTENANCE", "1") == "1"
+PARTITION_INTERVAL = os.getenv("PARTITION_INTERVAL", "month")                # "month" or "week"
+PARTITION_PREMAKE = int(os.getenv("PARTITION_PREMAKE", "3"))                 # Future partitions kept ready
+SENSORSDATA_RETENTION_DAYS = int(os.getenv("SENSORSDATA_RETENTION_DAYS", "0"))  # 0 keeps all data
+PARTITION_CHECK_INTERVAL = float(os.getenv("PARTITION_CHECK_INTERVAL", "3600"))  # Seconds between maintenance runs
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")           # Give up DDL rather than stall queries
@@ -1,23 +1,57 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from schemas.sensor_schema import MoistureDataListSchema, MoistureDataSchema, SensorDataDetailsResponse, SensorDataResponse, SensorDataSchema, UserPlantSensorSchema, SensorDataDetailsResponseList
 from services.sensor_service import get_service, SensorService
+from services.ingest_queue import IngestQueue, get_ingest_queue
+from services.partition_service import PartitionMaintenance, get_partition_maintenance
 from fastapi import  Depends
 from fastapi.responses import JSONResponse
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from config.authentication import get_current_user
+from schemas.columnar_batch import COLUMNAR_CONTENT_TYPE, decode_columnar_batch
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+import json
 
 moisture_router = APIRouter(redirect_slashes=False)
 
 
+async def parse_moisture_batch(request: Request) -> MoistureDataListSchema:
+    # Devices may send the batch as JSON ({"data": [...]}) or, to save bytes on metered
+    # links, as a columnar msgpack batch; the Content-Type header says which.
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    body = await request.body()
+    if content_type == COLUMNAR_CONTENT_TYPE:
+        try:
+            payload = {"data": decode_columnar_batch(body)}
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid Request: {e}")
+    else:
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise RequestValidationError([{"type": "json_invalid", "loc": ("body",), "msg": f"JSON decode error: {e}"}])
+    if not isinstance(payload, dict):
+        raise RequestValidationError([{"type": "model_attributes_type", "loc": ("body",), "msg": "Input should be an object"}])
+    try:
+        return MoistureDataListSchema(**payload)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
 @moisture_router.post("/api/send-data", response_model=dict)
 def add_moisture_entry(
-    sensors: MoistureDataListSchema, 
-    service: SensorService = Depends(get_service)
+    sensors: MoistureDataListSchema = Depends(parse_moisture_batch),
+    queue: Optional[IngestQueue] = Depends(get_ingest_queue)
 ):
     try:
-        # Call the service layer to add sensor moisture data
-        response = service.receive_moisture_data(sensors.data)
+        if queue is not None:
+            # Write-behind: durably queued; the flusher writes it with other devices' rows
+            return JSONResponse(status_code=202, content={"status": "queued", "queued": queue.append(sensors.data)})
+
+        # Device batches (and backfills) go through the bulk COPY path. The service is
+        # only created here: a SensorDAL holds a pooled connection until its call ends.
+        response = get_service().bulk_receive_moisture_data(sensors.data)
 
         # Check if the response contains an error
         if "error" in response:
@@ -34,12 +68,15 @@ def add_moisture_entry(
 @moisture_router.post("/api/send-current", response_model=dict)
 async def send_current_data(
     sensors: MoistureDataSchema, 
-    service: SensorService = Depends(get_service)
+    queue: Optional[IngestQueue] = Depends(get_ingest_queue)
 ):
     try:
         sensors = [sensors]
+        if queue is not None:
+            return JSONResponse(status_code=202, content={"status": "queued", "queued": queue.append(sensors)})
+
         # Call the service layer to add sensor moisture data
-        response = service.receive_moisture_data(sensors)
+        response = get_service().receive_moisture_data(sensors)
 
         # Check if the response contains an error
         if "error" in response:
@@ -53,6 +90,20 @@ async def send_current_data(
     except Exception as e:
         return JSONResponse(status_code=500, content={"status": "error", "message": f"Unexpected error: {str(e)}"})
 
+@moisture_router.get("/api/ingest/metrics", response_model=dict)
+def ingest_metrics(queue: Optional[IngestQueue] = Depends(get_ingest_queue)):
+    # Write-behind queue depth and flush lag; {"enabled": false} when ingest is synchronous.
+    if queue is None:
+        return {"enabled": False}
+    return dict(queue.stats(), enabled=True)
+
+@moisture_router.get("/api/partitions/metrics", response_model=dict)
+def partition_metrics(maintenance: Optional[PartitionMaintenance] = Depends(get_partition_maintenance)):
+    # Partitioning settings and the outcome of the last maintenance run.
+    if maintenance is None:
+        return {"enabled": False}
+    return dict(maintenance.stats(), enabled=True)
+
 @moisture_router.get("/api/send-current", response_model=dict)
 async def get_current_data(
     service: SensorService = Depends(get_service)
@@ -98,11 +149,13 @@ async def get_sensor_data(
 @moisture_router.delete("/api/sensor_data/{reading_id}")
 async def delete_sensor_data(
     reading_id: str, 
+    deviceid: str,
     service: SensorService = Depends(get_service),
     current_user: str = Depends(get_current_user)
 ):
     try: 
-        response = service.delete_sensor_data(reading_id)
+        # Reading ids are only unique per device, so the device is required
+        response = service.delete_sensor_data(reading_id, deviceid)
 
         if "error" in response:
             status_code = 400 if "Duplicate" in response["error"] else 500
@@ -146,6 +199,7 @@ async def get_sensor_data_by_username(
 @moisture_router.patch("/api/sensor_data/{reading_id}")
 async def update_sensor_data(
     reading_id: str,
+    deviceid: str,
     update_data: dict,
     service: SensorService = Depends(get_service),
     current_user: str = Depends(get_current_user)
@@ -177,7 +231,7 @@ async def update_sensor_data(
                 content={"status": "error", "error": "No valid fields to update"}
             )
 
-        response = service.update_sensor_data(reading_id, db_update_data)
+        response = service.update_sensor_data(reading_id, deviceid, db_update_data)
 
         if "error" in response:
             status_code = 400 if "Duplicate" in response["error"] else 500
@@ -235,6 +289,8 @@ async def add_sensor_data(
 async def get_sensor_data_details_by_sensorid_and_deviceid(
     sensorid: str,
     deviceid: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     service: SensorService = Depends(get_service),
     current_user: str = Depends(get_current_user)
 ):
@@ -247,7 +303,8 @@ async def get_sensor_data_details_by_sensorid_and_deviceid(
                 detail="Sensor ID and Device ID are required"
             )
 
-        response = service.get_sensor_data_details_by_sensorid_and_deviceid(sensorid, deviceid)
+        # since/until bound the scan to the partitions that cover the range
+        response = service.get_sensor_data_details_by_sensorid_and_deviceid(sensorid, deviceid, since, until)
 
         if "error" in response:
             status_code = 400 if "Duplicate" in response["error"] else 500
@@ -266,11 +323,12 @@ async def get_sensor_data_details_by_sensorid_and_deviceid(
 async def get_moisture_level(
     sensorid: str,
     deviceid: str,
+    since: Optional[datetime] = None,
     service: SensorService = Depends(get_service),
     current_user: str = Depends(get_current_user)
 ):
     try:
-        response = service.get_last_status(sensorid, deviceid)
+        response = service.get_last_status(sensorid, deviceid, since)
         print(response)
         if "error" in response:
             status_code = 400 if "Duplicate" in response["error"] else 500
@@ -0,0 +1,117 @@
+from config.database import get_connection, release_connection
+from datetime import datetime
+from psycopg2 import sql
+import re
+
+PARENT_TABLE = "sensorsdata"
+MAINTENANCE_LOCK_KEY = 0x73656e73  # pg advisory lock held while one process maintains partitions
+BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def _parse_bound(value: str):
+    # One side of a range bound as printed by pg_get_expr: MINVALUE, MAXVALUE or a
+    # quoted timestamp. The open ends come back as None.
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'")[:19])
+
+
+class PartitionDAL:
+    """
+    Catalog reads and DDL for the partitions of sensorsdata. Unlike the request DALs
+    it keeps its connection across calls; the caller releases it with release().
+    Every DDL method commits on success and rolls back and re-raises on failure.
+    """
+
+    def __init__(self, lock_timeout: str = "5s"):
+        self.conn = get_connection()
+        self.cursor = self.conn.cursor()
+        self.lock_timeout = lock_timeout
+
+    def release(self):
+        self.conn.rollback()
+        self.cursor.execute("SELECT pg_advisory_unlock_all();")
+        self.conn.commit()
+        release_connection(self.conn)
+
+    def try_lock(self) -> bool:
+        # Session lock so only one server process runs maintenance at a time.
+        self.cursor.execute("SELECT pg_try_advisory_lock(%s);", (MAINTENANCE_LOCK_KEY,))
+        locked = self.cursor.fetchone()[0]
+        self.conn.commit()
+        return locked
+
+    def is_partitioned(self) -> bool:
+        self.cursor.execute("""
+            SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = %s AND pg_table_is_visible(c.oid);
+        """, (PARENT_TABLE,))
+        partitioned = self.cursor.fetchone() is not None
+        self.conn.commit()
+        return partitioned
+
+    def list_partitions(self):
+        """
+        Partitions of sensorsdata as (name, lower, upper) ordered by lower bound, with
+        None for an open end, and the name of the default partition (or None).
+        """
+        self.cursor.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s AND pg_table_is_visible(p.oid);
+        """, (PARENT_TABLE,))
+        rows = self.cursor.fetchall()
+        self.conn.commit()
+        partitions, default = [], None
+        for name, bound in rows:
+            if bound == "DEFAULT":
+                default = name
+                continue
+            match = BOUND_PATTERN.search(bound)
+            if match:
+                partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+        partitions.sort(key=lambda p: p[1] or datetime.min)
+        return partitions, default
+
+    def _ddl(self, statements):
+        # Run statements in one transaction under lock_timeout; returns their rowcounts.
+        try:
+            self.cursor.execute("SET LOCAL lock_timeout = %s;", (self.lock_timeout,))
+            counts = []
+            for statement, params in statements:
+                self.cursor.execute(statement, params)
+                counts.append(self.cursor.rowcount)
+            self.conn.commit()
+            return counts
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def create_partition(self, name: str, lower: datetime, upper: datetime, default: str = None) -> int:
+        """
+        Create partition [lower, upper). It is built as a plain table and attached, so
+        rows for the range that had landed in the default partition move into it and
+        the parent is never locked exclusively. Returns the number of rows moved.
+        """
+        table, parent = sql.Identifier(name), sql.Identifier(PARENT_TABLE)
+        statements = [(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);").format(
+            table, parent), None)]
+        if default:
+            statements.append((sql.SQL("""
+                WITH moved AS (DELETE FROM {} WHERE timestamp >= %s AND timestamp < %s RETURNING *)
+                INSERT INTO {} SELECT * FROM moved;
+            """).format(sql.Identifier(default), table), (lower, upper)))
+        statements.append((sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);").format(
+            parent, table), (lower, upper)))
+        counts = self._ddl(statements)
+        return counts[1] if default else 0
+
+    def drop_partition(self, name: str):
+        self._ddl([(sql.SQL("DROP TABLE {};").format(sql.Identifier(name)), None)])
+
+    def prune_default(self, default: str, cutoff: datetime) -> int:
+        # Expired rows that arrived after their partition was dropped land in the default.
+        return self._ddl([(sql.SQL("DELETE FROM {} WHERE timestamp < %s;").format(sql.Identifier(default)),
+                           (cutoff,))])[0]
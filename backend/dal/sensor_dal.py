@@ -2,7 +2,60 @@ from config.database import get_connection, release_connection
 from schemas.sensor_schema import MoistureDataSchema
 import psycopg2 
 from psycopg2 import  DatabaseError, IntegrityError
-from typing import List
+from typing import List, Optional
+from datetime import datetime
+
+# Columns loaded by the bulk COPY path, in COPY order.
+BULK_COLUMNS = (
+    "readingid", "timestamp", "deviceid", "sensorid", "adcvalue", "moisturelevel", "digitalstatus",
+    "weathertemp", "weatherhumidity", "weathersunlight", "weatherwindspeed", "location", "weatherfetched",
+)
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value):
+    # One field in COPY text format.
+    if value is None:
+        return "\\N"
+    if isinstance(value, str):
+        return value.translate(COPY_ESCAPES)
+    return str(value)
+
+
+def _time_range(since, until):
+    # Extra WHERE terms bounding timestamp. sensorsdata is partitioned by timestamp, so
+    # a bounded query only scans the partitions that overlap the range.
+    clauses, params = "", []
+    if since is not None:
+        clauses += " AND timestamp >= %s"
+        params.append(since)
+    if until is not None:
+        clauses += " AND timestamp < %s"
+        params.append(until)
+    return clauses, params
+
+
+class CopyStream:
+    """File-like object feeding rows to copy_expert in COPY text format, encoded as read."""
+
+    def __init__(self, rows):
+        self.lines = ("\t".join(map(_copy_value, row)) + "\n" for row in rows)
+        self.buffer = ""
+
+    def read(self, size=-1):
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            length += len(line)
+        data = "".join(parts)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
 
 
 class SensorDAL:
@@ -12,12 +65,17 @@ class SensorDAL:
 
     def receive_moisture_data(self, sensors: List[MoistureDataSchema]):
         try:
+            # The ingest key is the only unique index on sensorsdata: (deviceid, readingid)
+            # from migration 001, or (deviceid, readingid, timestamp) once 002 partitions the
+            # table. ON CONFLICT names no target so the inserts work under either.
             # Bulk insert query
             insert_query = """
                 INSERT INTO sensorsdata (
                     readingid, timestamp, deviceid, sensorid, adcvalue, moisturelevel, digitalstatus,
                     weathertemp, weatherhumidity, weathersunlight, weatherwindspeed, location, weatherfetched
-                ) VALUES %s RETURNING readingid;
+                ) VALUES %s
+                ON CONFLICT DO NOTHING
+                RETURNING readingid;
             """
             # Convert list of objects to list of tuples
             values = [
@@ -28,13 +86,15 @@ class SensorDAL:
                 )
                 for sensor in sensors
             ]
-            # Execute bulk insert
-            psycopg2.extras.execute_values(self.cursor, insert_query, values)
+            # Execute bulk insert; readings already stored for the device are skipped.
+            # fetch=True collects RETURNING rows from every page, not just the last.
+            inserted = psycopg2.extras.execute_values(self.cursor, insert_query, values, fetch=True)
             self.conn.commit()
 
             # Get the returned sensor_id
-            inserted_ids = [row[0] for row in self.cursor.fetchall()]
-            return {"status": "success", "inserted_ids": inserted_ids}
+            inserted_ids = [row[0] for row in inserted]
+            return {"status": "success", "inserted_ids": inserted_ids,
+                    "duplicates": len(values) - len(inserted_ids)}
 
         except (psycopg2.Error, DatabaseError) as db_error:
             # Handle other database errors
@@ -69,6 +129,92 @@ class SensorDAL:
             # Ensure that the connection is released
             release_connection(self.conn)
 
+    def bulk_receive_moisture_data(self, sensors: List[MoistureDataSchema]):
+        """
+        Bulk ingest: stream the batch into a session-local staging table with COPY,
+        then move it into sensorsdata with a single INSERT ... SELECT. Readings already
+        stored for the device, e.g. from a resent batch, are skipped. If any row is
+        rejected by the database, the batch is retried row by row so only that row is
+        dropped. Returns counts (received, inserted, duplicates, rejected ids) and the
+        highest reading id instead of every id.
+        """
+        try:
+            # Temp tables live as long as the pooled connection; ON COMMIT DELETE ROWS
+            # empties it at the end of every transaction.
+            self.cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS sensorsdata_staging
+                (LIKE sensorsdata INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+            """)
+            rows = [
+                (
+                    sensor.id, sensor.timestamp, sensor.device_id, sensor.sensor_id, sensor.adc_value,
+                    sensor.moisture_level, sensor.digital_status, sensor.weather_temp, sensor.weather_humidity,
+                    sensor.weather_sunlight, sensor.weather_wind_speed, sensor.location, sensor.weather_fetched
+                )
+                for sensor in sensors
+            ]
+            columns = ", ".join(BULK_COLUMNS)
+            rejected = []
+            self.cursor.execute("SAVEPOINT bulk_ingest;")
+            try:
+                self.cursor.copy_expert(f"COPY sensorsdata_staging ({columns}) FROM STDIN", CopyStream(rows))
+                self.cursor.execute(f"""
+                    WITH inserted AS (
+                        INSERT INTO sensorsdata ({columns})
+                        SELECT {columns} FROM sensorsdata_staging
+                        ON CONFLICT DO NOTHING
+                        RETURNING readingid
+                    )
+                    SELECT COUNT(*) FROM inserted;
+                """)
+                inserted = self.cursor.fetchone()[0]
+            except (psycopg2.DataError, IntegrityError) as row_error:
+                print(f"Bulk ingest rejected, inserting row by row: {row_error}")
+                self.cursor.execute("ROLLBACK TO SAVEPOINT bulk_ingest;")
+                inserted = 0
+                insert_row = f"""
+                    INSERT INTO sensorsdata ({columns}) VALUES %s
+                    ON CONFLICT DO NOTHING;
+                """
+                for row in rows:
+                    self.cursor.execute("SAVEPOINT bulk_row;")
+                    try:
+                        self.cursor.execute(insert_row, (row,))
+                        inserted += self.cursor.rowcount
+                    except (psycopg2.DataError, IntegrityError):
+                        self.cursor.execute("ROLLBACK TO SAVEPOINT bulk_row;")
+                        rejected.append(row[0])
+            self.conn.commit()
+            return {
+                "status": "success",
+                "received": len(rows),
+                "inserted": inserted,
+                "duplicates": len(rows) - inserted - len(rejected),
+                "rejected": rejected,
+                "max_id": max((row[0] for row in rows), default=None),
+            }
+
+        except (psycopg2.Error, DatabaseError) as db_error:
+            self.conn.rollback()
+            error_message = f"Database error: {db_error}"
+            print(f"Database error: {db_error}")
+            return {
+                "status": "Database error",
+                "error": error_message
+            }
+
+        except Exception as e:
+            self.conn.rollback()
+            error_message = f"Unexpected error: {e}"
+            print(f"Unexpected error: {e}")
+            return {
+                "status": "error",
+                "error": error_message
+            }
+
+        finally:
+            release_connection(self.conn)
+
     def get_sensor_data(self, username: str):
         try:
            
@@ -187,25 +333,25 @@ class SensorDAL:
         finally:
             release_connection(self.conn)
 
-    def delete_sensor_data(self, reading_id: str):
+    def delete_sensor_data(self, reading_id: str, deviceid: str):
         try:
-            # Check if the reading_id exists
+            # Reading ids are only unique per device, so every lookup is scoped by deviceid
             self.cursor.execute(
-                "SELECT readingid FROM sensorsdata WHERE readingid = %s;",
-                (reading_id,)
+                "SELECT readingid FROM sensorsdata WHERE deviceid = %s AND readingid = %s;",
+                (deviceid, reading_id)
             )
             existing_record = self.cursor.fetchone()
 
             if not existing_record:
                 return {
                     "status": "error",
-                    "message": f"No sensor data found with ID: {reading_id}"
+                    "message": f"No sensor data found with ID: {reading_id} for device {deviceid}"
                 }
 
             # Delete the record
             self.cursor.execute(
-                "DELETE FROM sensorsdata WHERE readingid = %s;",
-                (reading_id,)
+                "DELETE FROM sensorsdata WHERE deviceid = %s AND readingid = %s;",
+                (deviceid, reading_id)
             )
             self.conn.commit()  # Commit the transaction
 
@@ -235,19 +381,19 @@ class SensorDAL:
         finally:
             release_connection(self.conn)  # Release the connection
 
-    def update_sensor_data(self, reading_id: str, update_data: dict):
+    def update_sensor_data(self, reading_id: str, deviceid: str, update_data: dict):
         try:
-            # Check if the reading_id exists
+            # Check if the reading exists for this device
             self.cursor.execute(
-                "SELECT readingid FROM sensorsdata WHERE readingid = %s;",
-                (reading_id,)
+                "SELECT readingid FROM sensorsdata WHERE deviceid = %s AND readingid = %s;",
+                (deviceid, reading_id)
             )
             existing_record = self.cursor.fetchone()
 
             if not existing_record:
                 return {
                     "status": "error",
-                    "error": f"No sensor data found with ID: {reading_id}"
+                    "error": f"No sensor data found with ID: {reading_id} for device {deviceid}"
                 }
 
             # Build the update query dynamically based on provided fields
@@ -266,14 +412,14 @@ class SensorDAL:
                     "error": "No valid fields to update"
                 }
 
-            # Add reading_id to values for the WHERE clause
-            values.append(reading_id)
+            # Add deviceid and reading_id to values for the WHERE clause
+            values.extend([deviceid, reading_id])
 
             # Construct and execute the update query
             update_query = f"""
                 UPDATE sensorsdata 
                 SET {', '.join(update_fields)}
-                WHERE readingid = %s
+                WHERE deviceid = %s AND readingid = %s
                 RETURNING readingid;
             """
             
@@ -321,7 +467,7 @@ class SensorDAL:
                     readingid, sensorid, deviceid, adcvalue, moisturelevel, digitalstatus,
                     weathertemp, weatherhumidity, weathersunlight, weatherwindspeed,
                     weatherfetched, timestamp, location
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 RETURNING readingid, timestamp, sensorid, adcvalue, moisturelevel, digitalstatus,
                          weathertemp, weatherhumidity, weathersunlight, weatherwindspeed,
                          location, weatherfetched;
@@ -440,16 +586,18 @@ class SensorDAL:
             print(f"Unexpected error: {e}")
             return {"status": "error", "error": str(e)}
 
-    def get_sensor_data_details_by_sensorid_and_deviceid(self, sensorid: str, deviceid: str):
+    def get_sensor_data_details_by_sensorid_and_deviceid(self, sensorid: str, deviceid: str,
+                                                         since: Optional[datetime] = None,
+                                                         until: Optional[datetime] = None):
         try:
-
-            self.cursor.execute("""
+            time_range, params = _time_range(since, until)
+            self.cursor.execute(f"""
                 SELECT readingid, adcvalue, moisturelevel AS "Water Level", digitalstatus, timestamp AS "Date_Time"
                 FROM sensorsdata
-                WHERE sensorid = %s AND deviceid = %s 
+                WHERE sensorid = %s AND deviceid = %s {time_range}
                 ORDER BY readingid DESC 
                 LIMIT 5
-            """, (sensorid, deviceid))
+            """, (sensorid, deviceid, *params))
 
             results = self.cursor.fetchall()
 
@@ -482,15 +630,20 @@ class SensorDAL:
             print(f"Unexpected error: {e}")
             return {"status": "error", "error": str(e)}
 
-    def get_last_status(self, sensorid: str, deviceid: str):
+        finally:
+            # An open read transaction would hold locks that block partition maintenance
+            release_connection(self.conn)
+
+    def get_last_status(self, sensorid: str, deviceid: str, since: Optional[datetime] = None):
         try:
-            self.cursor.execute("""
+            time_range, params = _time_range(since, None)
+            self.cursor.execute(f"""
                 SELECT moisturelevel
                 FROM sensorsdata
-                WHERE sensorid = %s AND deviceid = %s
+                WHERE sensorid = %s AND deviceid = %s {time_range}
                 ORDER BY readingid DESC
                 LIMIT 1
-                """, (sensorid, deviceid))
+                """, (sensorid, deviceid, *params))
             
             results = self.cursor.fetchone()
 
@@ -513,7 +666,11 @@ class SensorDAL:
         except Exception as e:
             self.conn.rollback()
             print(f"Unexpected error: {e}")
-            return {"status": "error", "error": str(e)} 
+            return {"status": "error", "error": str(e)}
+
+        finally:
+            # An open read transaction would hold locks that block partition maintenance
+            release_connection(self.conn)
         
     def get_sensor_id_by_device_id(self, deviceid: str):
         try:
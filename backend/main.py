@@ -1,15 +1,91 @@
 from fastapi import FastAPI
 from controller.plant_controller import plant_router
 from controller.moisture_controller import moisture_router
-from config.database import Base, engine
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from controller.auth_controller import auth_router
+from services.ingest_queue import get_ingest_queue
+from services.partition_service import get_partition_maintenance
+from config.migrations import MIGRATE_ON_STARTUP
+from migrations import migrate
+from contextlib import asynccontextmanager
+import zlib
 
-# Initialize database
-Base.metadata.create_all(bind=engine)
+MAX_DECOMPRESSED_BODY = 10 * 1024 * 1024  # Reject gzip bodies that inflate past 10 MB
+
+
+class GzipRequestMiddleware:
+    """Decompress request bodies sent with Content-Encoding: gzip (device uplink batches)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        encoding = dict(scope["headers"]).get(b"content-encoding", b"").lower()
+        if encoding != b"gzip":
+            return await self.app(scope, receive, send)
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        try:
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            body = inflater.decompress(b"".join(chunks), MAX_DECOMPRESSED_BODY)
+            if inflater.unconsumed_tail:
+                return await self._reject(send, 413, "Decompressed body too large")
+        except zlib.error:
+            return await self._reject(send, 400, "Invalid gzip body")
+
+        scope = dict(scope, headers=headers + [(b"content-length", str(len(body)).encode())])
+        sent = False
+
+        async def receive_body():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, receive_body, send)
+
+    async def _reject(self, send, status, error):
+        content = JSONResponse(status_code=status, content={"status": "error", "error": error})
+        await send({"type": "http.response.start", "status": status, "headers": content.raw_headers})
+        await send({"type": "http.response.body", "body": content.body})
+
+@asynccontextmanager
+async def lifespan(app):
+    # The schema is owned by migrations/NNN_*.sql, normally applied as a deploy step
+    if MIGRATE_ON_STARTUP:
+        applied = migrate.upgrade()
+        if applied:
+            print(f"Applied migrations: {applied}")
+    else:
+        pending = [version for version, _, applied_at in migrate.status() if applied_at is None]
+        if pending:
+            print(f"Warning: migrations {pending} are pending; run \"python -m migrations.migrate\"")
+    # Run the write-behind ingest flusher for the life of the app (when enabled)
+    queue = get_ingest_queue()
+    if queue is not None:
+        queue.start()
+    # Keep sensorsdata partitions created ahead of time and apply retention
+    partitions = get_partition_maintenance()
+    if partitions is not None:
+        partitions.start()
+    yield
+    if partitions is not None:
+        partitions.stop()
+    if queue is not None:
+        queue.stop()
 
 # FastAPI App
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +95,8 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+app.add_middleware(GzipRequestMiddleware)
+
 # Include Routes
 app.include_router(plant_router)
 app.include_router(moisture_router)
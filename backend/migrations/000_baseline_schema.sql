@@ -0,0 +1,43 @@
+-- The schema the DAL queries, as it stood before versioned migrations. Every statement
+-- is IF NOT EXISTS: on an existing database this only records the baseline, and on a
+-- fresh one it creates the tables that the later migrations alter.
+CREATE TABLE IF NOT EXISTS userdata (
+    userid SERIAL PRIMARY KEY,
+    firstname VARCHAR(50),
+    lastname VARCHAR(50),
+    username VARCHAR(50) NOT NULL UNIQUE,
+    userpassword VARCHAR(255) NOT NULL,
+    email VARCHAR(100),
+    phonenumber VARCHAR(20),
+    deviceid VARCHAR(50)
+);
+
+CREATE TABLE IF NOT EXISTS plant (
+    plantid SERIAL PRIMARY KEY,
+    plantname VARCHAR(50) NOT NULL,
+    scientificname VARCHAR(50),
+    userid INTEGER
+);
+
+-- One row per sensor channel of a device, linked to the plant it is placed in.
+CREATE TABLE IF NOT EXISTS sensors (
+    sensorid INTEGER NOT NULL,
+    deviceid VARCHAR(50) NOT NULL,
+    plantid INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS sensorsdata (
+    readingid INTEGER PRIMARY KEY,
+    timestamp TIMESTAMP,
+    deviceid VARCHAR(50),
+    sensorid INTEGER,
+    adcvalue FLOAT,
+    moisturelevel FLOAT,
+    digitalstatus VARCHAR(20),
+    weathertemp FLOAT,
+    weatherhumidity FLOAT,
+    weathersunlight FLOAT,
+    weatherwindspeed FLOAT,
+    location VARCHAR(100),
+    weatherfetched TIMESTAMP
+);
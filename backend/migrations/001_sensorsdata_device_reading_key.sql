@@ -0,0 +1,7 @@
+-- Readings are identified by the device's local SQLite id, which is only unique per
+-- device. Ingest upserts on (deviceid, readingid) with ON CONFLICT DO NOTHING, so a
+-- resent batch is a no-op and two devices' ids never collide.
+ALTER TABLE sensorsdata DROP CONSTRAINT IF EXISTS sensorsdata_pkey;
+ALTER TABLE sensorsdata ALTER COLUMN deviceid SET NOT NULL;
+ALTER TABLE sensorsdata ALTER COLUMN readingid SET NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS sensorsdata_device_reading_key ON sensorsdata (deviceid, readingid);
@@ -0,0 +1,60 @@
+-- Range-partition sensorsdata by timestamp. A query bounded in time only scans the
+-- partitions it overlaps, and retention drops whole partitions instead of deleting
+-- rows (services/partition_service.py, which also creates future partitions).
+--
+-- Existing rows are not copied. The old table becomes one partition covering
+-- everything before the current month, and only current-month rows are moved out.
+-- A CHECK constraint proves its bound, so SET NOT NULL and ATTACH skip their scans;
+-- the cost is one scan for the move, one for the CHECK and building the new unique
+-- index. Retention drops the old partition like any other once it lies wholly past
+-- the cutoff.
+--
+-- A unique index on a partitioned table must include the partition key, so the
+-- ingest key becomes (deviceid, readingid, timestamp). A device resends a reading
+-- with its original timestamp, so a resent batch still conflicts and is skipped.
+--
+-- Rows with a NULL timestamp cannot be routed to a partition; the CHECK below fails
+-- if any exist, and they must be fixed or removed first. The whole migration
+-- holds an exclusive lock on sensorsdata; run it while ingest is stopped.
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'sensorsdata'::regclass) THEN
+        RAISE EXCEPTION 'sensorsdata is already partitioned; record this migration with '
+                        '"python -m migrations.migrate mark 2" instead of running it';
+    END IF;
+END $$;
+
+ALTER TABLE sensorsdata RENAME TO sensorsdata_legacy;
+ALTER INDEX sensorsdata_device_reading_key RENAME TO sensorsdata_legacy_device_reading_key;
+
+CREATE TABLE sensorsdata (LIKE sensorsdata_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    PARTITION BY RANGE (timestamp);
+ALTER TABLE sensorsdata ALTER COLUMN timestamp SET NOT NULL;
+CREATE UNIQUE INDEX sensorsdata_device_reading_key ON sensorsdata (deviceid, readingid, timestamp);
+
+-- Catches rows outside every partition (e.g. a device with a wrong clock) so ingest
+-- never fails on routing. Partition maintenance moves them out as partitions appear.
+CREATE TABLE sensorsdata_default PARTITION OF sensorsdata DEFAULT;
+
+DO $$
+DECLARE
+    cutoff timestamp := date_trunc('month', now()::timestamp);
+    current_name text := 'sensorsdata_p' || to_char(cutoff, 'YYYYMMDD');
+BEGIN
+    EXECUTE format('CREATE TABLE %I (LIKE sensorsdata INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', current_name);
+    EXECUTE format('WITH moved AS (DELETE FROM sensorsdata_legacy WHERE timestamp >= %L RETURNING *) '
+                   'INSERT INTO %I SELECT * FROM moved', cutoff, current_name);
+    EXECUTE format('ALTER TABLE sensorsdata ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   current_name, cutoff, cutoff + interval '1 month');
+
+    EXECUTE format('ALTER TABLE sensorsdata_legacy ADD CONSTRAINT sensorsdata_legacy_bound '
+                   'CHECK (timestamp IS NOT NULL AND timestamp < %L)', cutoff);
+    ALTER TABLE sensorsdata_legacy ALTER COLUMN timestamp SET NOT NULL;
+    EXECUTE format('ALTER TABLE sensorsdata ATTACH PARTITION sensorsdata_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+                   cutoff);
+END $$;
+
+-- The parent's unique index now covers the old table too; its two-column index is redundant.
+DROP INDEX sensorsdata_legacy_device_reading_key;
+ALTER TABLE sensorsdata_legacy DROP CONSTRAINT sensorsdata_legacy_bound;
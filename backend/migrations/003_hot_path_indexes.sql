@@ -0,0 +1,37 @@
+-- Indexes for the DAL's access paths. python -m migrations.plan_check asserts that
+-- every DAL query is planned on them rather than on sequential scans.
+--
+-- The dashboard polls get_last_status and get_sensor_data_details_by_sensorid_and_deviceid
+-- (WHERE sensorid = %s AND deviceid = %s ORDER BY readingid DESC LIMIT n). With
+-- (sensorid, deviceid, readingid) each partition is read backwards from the newest
+-- reading and the LIMIT stops after a few rows; sensorid leads so get_sensor_data_by_id
+-- (WHERE sensorid = %s) uses it too. On a partitioned sensorsdata the index is created
+-- on every partition, and partition maintenance attaches it to new ones. The build
+-- blocks writes to sensorsdata; run it while ingest is stopped.
+CREATE INDEX IF NOT EXISTS sensorsdata_sensor_device_reading_idx ON sensorsdata (sensorid, deviceid, readingid);
+
+-- delete_sensor_data and update_sensor_data (WHERE deviceid = %s AND readingid = %s)
+-- are served by the unique ingest key, which leads with the same two columns.
+
+-- get_sensor_id_by_device_id (WHERE deviceid = %s AND plantid IS NULL) and create_plant
+-- (WHERE deviceid = %s AND sensorid = %s); delete_plant filters on sensorid alone.
+CREATE INDEX IF NOT EXISTS sensors_device_sensor_idx ON sensors (deviceid, sensorid);
+CREATE INDEX IF NOT EXISTS sensors_sensorid_idx ON sensors (sensorid);
+
+-- The userdata -> plant -> sensors joins behind get_plants, get_sensor_data and
+-- get_sensor_data_by_username.
+CREATE INDEX IF NOT EXISTS plant_userid_idx ON plant (userid);
+CREATE INDEX IF NOT EXISTS sensors_plantid_idx ON sensors (plantid);
+
+-- Login and every per-user lookup filter on username. The baseline declares it UNIQUE,
+-- but databases created before versioned migrations may have no index on it.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'userdata'::regclass AND a.attname = 'username'
+    ) THEN
+        CREATE INDEX userdata_username_idx ON userdata (username);
+    END IF;
+END $$;
@@ -0,0 +1,131 @@
+import os
+import re
+import sys
+import hashlib
+
+from config.database import get_connection, release_connection
+
+# Versioned schema migrations. Each migrations/NNN_name.sql file runs once, in version
+# order, inside one transaction together with its row in schema_migrations, so a
+# failed migration leaves nothing behind. Files must not contain BEGIN/COMMIT.
+#
+#   python -m migrations.migrate            apply pending migrations
+#   python -m migrations.migrate status     list applied and pending versions
+#   python -m migrations.migrate mark N     record versions up to N as applied without
+#                                           running them (schema changed by hand)
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+FILE_PATTERN = re.compile(r"^(\d{3})_(\w+)\.sql$")
+MIGRATION_LOCK_KEY = 0x6d696772  # pg advisory lock serializing runners across server processes
+
+
+def discover():
+    """Migration files as (version, name, sql, checksum) in version order."""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename)) as f:
+            sql = f.read()
+        migrations.append((int(match.group(1)), match.group(2), sql, hashlib.sha256(sql.encode()).hexdigest()))
+    versions = [m[0] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Two migration files share a version number")
+    return migrations
+
+
+def _applied(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+    """)
+    cursor.execute("SELECT version, checksum FROM schema_migrations;")
+    return dict(cursor.fetchall())
+
+
+def _run(action):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        # Session-level lock: a second process waits here, then finds nothing pending.
+        cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+        return action(conn, cursor)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+        release_connection(conn)
+
+
+def upgrade():
+    """Apply pending migrations; returns the versions applied. Raises on a failed one."""
+    def apply(conn, cursor):
+        applied = _applied(cursor)
+        conn.commit()
+        done = []
+        for version, name, sql, checksum in discover():
+            if version in applied:
+                if applied[version] != checksum:
+                    print(f"Warning: migration {version:03d}_{name} changed after it was applied")
+                continue
+            print(f"Applying migration {version:03d}_{name}")
+            try:
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s);",
+                               (version, name, checksum))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise RuntimeError(f"Migration {version:03d}_{name} failed: {e}") from e
+            done.append(version)
+        return done
+    return _run(apply)
+
+
+def status():
+    """[(version, name, applied_at or None)] for every migration file."""
+    def read(conn, cursor):
+        _applied(cursor)
+        cursor.execute("SELECT version, applied_at FROM schema_migrations;")
+        applied_at = dict(cursor.fetchall())
+        conn.commit()
+        return [(version, name, applied_at.get(version)) for version, name, _, _ in discover()]
+    return _run(read)
+
+
+def mark(through: int):
+    """Record every migration up to version through as applied without running it."""
+    def record(conn, cursor):
+        _applied(cursor)
+        marked = []
+        for version, name, _, checksum in discover():
+            if version <= through:
+                cursor.execute("""
+                    INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)
+                    ON CONFLICT (version) DO NOTHING;
+                """, (version, name, checksum))
+                if cursor.rowcount:
+                    marked.append(version)
+        conn.commit()
+        return marked
+    return _run(record)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    if command == "up":
+        print(f"Applied: {upgrade() or 'nothing pending'}")
+    elif command == "status":
+        for version, name, applied_at in status():
+            print(f"{version:03d}_{name:40s} {applied_at or 'pending'}")
+    elif command == "mark" and len(sys.argv) == 3:
+        print(f"Marked as applied: {mark(int(sys.argv[2])) or 'nothing new'}")
+    else:
+        sys.exit("usage: python -m migrations.migrate [up | status | mark VERSION]")
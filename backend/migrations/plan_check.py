@@ -0,0 +1,158 @@
+import re
+import sys
+from datetime import datetime
+
+from dal.sensor_dal import SensorDAL
+from dal.plant_dal import PlantDAL
+from dal.user_dal import UserDAL
+from schemas.sensor_schema import MoistureDataSchema
+from schemas.plant_schema import PlantSchema
+
+# Query-plan check for the DAL. Each DAL method below is called with its cursor swapped
+# for ExplainCursor, which plans every query instead of running it and records the
+# plan. Sequential scans are disabled while planning, so a query fails the check
+# when it still reads a table with one, or uses an index without a condition on its
+# leading column (a walk over the whole index): either way no index serves it.
+#
+# Run it against a freshly migrated, empty database (as in CI). Without statistics the
+# planner takes an index whenever one can serve the query, so the result reflects the
+# schema; on a loaded database it may rightly prefer another plan for unselective
+# parameters, and those show up as failures too.
+#
+#   python -m migrations.plan_check
+
+EXPLAINED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+PASSED_THROUGH = ("CREATE TEMP", "SAVEPOINT", "ROLLBACK TO", "RELEASE")  # Setup the planned queries need
+
+SAMPLE_READING = MoistureDataSchema(
+    id=1, timestamp=datetime(2026, 1, 1), device_id="plan-check", sensor_id=1, adc_value=12000,
+    moisture_level=50.0, digital_status="Wet", weather_temp=20.0, weather_humidity=60.0,
+    weather_sunlight=300.0, weather_wind_speed=3.0, location="plan-check", weather_fetched=datetime(2026, 1, 1),
+)
+SAMPLE_PLANT = PlantSchema(plant_name="plan-check", user_id="1", sensor_id="1", device_id="plan-check")
+
+CHECKS = [
+    (SensorDAL, "receive_moisture_data", ([SAMPLE_READING],)),
+    (SensorDAL, "bulk_receive_moisture_data", ([SAMPLE_READING],)),
+    (SensorDAL, "get_sensor_data", ("plan-check",)),
+    (SensorDAL, "get_sensor_data_by_id", ("1",)),
+    (SensorDAL, "delete_sensor_data", ("1", "plan-check")),
+    (SensorDAL, "update_sensor_data", ("1", "plan-check", {"moisturelevel": 50.0})),
+    (SensorDAL, "add_sensor_data", ({"readingid": 1, "sensorid": 1, "deviceid": "plan-check", "adcvalue": 12000,
+                                     "moisturelevel": 50.0, "digitalstatus": "Wet", "weathertemp": 20.0,
+                                     "weatherhumidity": 60.0, "weathersunlight": 300.0, "weatherwindspeed": 3.0,
+                                     "weatherfetched": datetime(2026, 1, 1), "timestamp": datetime(2026, 1, 1),
+                                     "location": "plan-check"},)),
+    (SensorDAL, "get_sensor_data_by_username", ("plan-check",)),
+    (SensorDAL, "get_sensor_data_details_by_sensorid_and_deviceid", ("1", "plan-check")),
+    (SensorDAL, "get_sensor_data_details_by_sensorid_and_deviceid", ("1", "plan-check", datetime(2026, 1, 1))),
+    (SensorDAL, "get_last_status", ("1", "plan-check")),
+    (SensorDAL, "get_sensor_id_by_device_id", ("plan-check",)),
+    (PlantDAL, "create_plant", (SAMPLE_PLANT, "plan-check")),
+    (PlantDAL, "get_plants", ("plan-check",)),
+    (PlantDAL, "delete_plant", ("1", "plan-check")),
+    (UserDAL, "get_user", ("plan-check",)),
+    (UserDAL, "create_user", ("plan", "check", "plan-check", "secret", "plan@check", "0")),
+]
+
+
+class ExplainCursor:
+    """
+    Stands in for a DAL cursor: records the plan of each query instead of running it.
+    Fetches return a row of zeros (or no rows), enough for the DAL to go on to its
+    next query.
+    """
+
+    def __init__(self, conn):
+        self.cursor = conn.cursor()
+        self.connection = conn
+        self.plans = []
+        self.leading = {}  # index name -> its first column
+        self.rowcount = 0
+
+    def mogrify(self, query, params=None):
+        return self.cursor.mogrify(query, params)
+
+    def execute(self, query, params=None):
+        text = query.decode() if isinstance(query, bytes) else query
+        head = text.lstrip().upper()
+        if head.startswith(PASSED_THROUGH):
+            self.cursor.execute(query, params)
+        elif head.startswith(EXPLAINED):
+            self.cursor.execute("SET LOCAL enable_seqscan = off;")
+            prefix = "EXPLAIN (VERBOSE, FORMAT JSON) "
+            self.cursor.execute(prefix.encode() + query if isinstance(query, bytes) else prefix + query, params)
+            plan = self.cursor.fetchone()[0][0]["Plan"]
+            self.plans.append((" ".join(text.split()), plan))
+            indexes = [s[3] for s in scans(plan) if s[3]]
+            if indexes:
+                self.cursor.execute("""
+                    SELECT c.relname, a.attname FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                    WHERE c.relname = ANY(%s);
+                """, (indexes,))
+                self.leading.update(self.cursor.fetchall())
+
+    def copy_expert(self, sql, file):
+        pass
+
+    def fetchone(self):
+        return (0,) * 16
+
+    def fetchall(self):
+        return []
+
+
+def scans(plan):
+    """(node type, relation, schema, index, index condition) for every table or index read."""
+    found = []
+    if "Relation Name" in plan or "Index Name" in plan:
+        found.append((plan["Node Type"], plan.get("Relation Name"), plan.get("Schema", ""), plan.get("Index Name"),
+                      plan.get("Index Cond", "")))
+    for child in plan.get("Plans", []):
+        found.extend(scans(child))
+    return found
+
+
+def unserved(scan, leading):
+    node, _, schema, index, condition = scan
+    if schema.startswith("pg_temp"):
+        return False  # Session-local temp tables (the bulk ingest staging table) are expected
+    if node == "Seq Scan":
+        return True
+    if index:
+        column = leading.get(index)
+        return column is None or not re.search(rf"\b{re.escape(column)}\b", condition)
+    return False
+
+
+def check():
+    """Plan every DAL query; returns (method, query, failing scans) for each failure."""
+    failures = []
+    for dal_class, method, args in CHECKS:
+        dal = dal_class()
+        cursor = dal.cursor = ExplainCursor(dal.conn)
+        try:
+            getattr(dal, method)(*args)
+        except Exception as e:
+            print(f"{dal_class.__name__}.{method} raised {e!r} (plans up to that point are still checked)")
+        finally:
+            dal.conn.rollback()
+        label = f"{dal_class.__name__}.{method}"
+        if not cursor.plans:
+            failures.append((label, None, "no query was planned"))
+        for query, plan in cursor.plans:
+            bad = [s for s in scans(plan) if unserved(s, cursor.leading)]
+            used = sorted({s[3] for s in scans(plan) if s[3]})
+            print(f"{'FAIL' if bad else 'ok  '} {label}: {', '.join(used) or 'no table scan'}")
+            if bad:
+                failures.append((label, query, ", ".join(f"{s[0]} on {s[3] or s[1]}" for s in bad)))
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check()
+    for label, query, problem in failures:
+        print(f"\n{label}: {problem}\n  {query}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,68 @@
+import msgpack
+from datetime import datetime, timedelta
+from typing import List
+
+# Columnar batch encoding sent by the device uplink (embedded/wire_format.py).
+# A msgpack map {"v": 1, "n": rows, <column>: <encoded column>, ...} where a column is:
+#   [v, v, ...]                       plain values
+#   {"delta": [first, d1, d2, ...]}   integers, each stored as the difference to the previous
+#   {"base": "YYYY-mm-dd HH:MM:SS", "delta": [...]}  timestamps as second deltas from base
+#   {"scale": 100, "v": [...]}        fixed-point numbers, value = v / scale
+#   {"dict": [s0, s1, ...], "idx": [...]}  repeated strings as indexes into dict
+COLUMNAR_CONTENT_TYPE = "application/x-msgpack"
+SUPPORTED_VERSIONS = (1,)
+
+COLUMNS = (
+    "id", "timestamp", "device_id", "sensor_id", "adc_value", "moisture_level", "digital_status",
+    "weather_temp", "weather_humidity", "weather_sunlight", "weather_wind_speed", "location",
+    "weather_fetched",
+)
+
+
+def _undelta(values, start=0):
+    out, current = [], start
+    for d in values:
+        current += d
+        out.append(current)
+    return out
+
+
+def _decode_column(name, column, n):
+    if isinstance(column, list):
+        values = column
+    elif "dict" in column:
+        strings = column["dict"]
+        values = [strings[i] for i in column["idx"]]
+    elif "scale" in column:
+        scale = column["scale"]
+        values = [v / scale for v in column["v"]]
+    elif "base" in column:
+        base = datetime.strptime(column["base"], "%Y-%m-%d %H:%M:%S")
+        values = [base + timedelta(seconds=s) for s in _undelta(column["delta"])]
+    elif "delta" in column:
+        values = _undelta(column["delta"])
+    else:
+        raise ValueError(f"Unknown encoding for column {name}")
+    if len(values) != n:
+        raise ValueError(f"Column {name} has {len(values)} values, expected {n}")
+    return values
+
+
+def decode_columnar_batch(body: bytes) -> List[dict]:
+    """Decode a columnar msgpack batch into row dicts matching MoistureDataSchema."""
+    try:
+        batch = msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        raise ValueError(f"Invalid msgpack body: {e}")
+    if not isinstance(batch, dict) or batch.get("v") not in SUPPORTED_VERSIONS:
+        raise ValueError("Unsupported columnar batch version")
+    n = batch.get("n")
+    if not isinstance(n, int) or n < 0:
+        raise ValueError("Missing row count")
+    try:
+        columns = [_decode_column(name, batch[name], n) for name in COLUMNS]
+    except KeyError as e:
+        raise ValueError(f"Missing column {e}")
+    except (TypeError, IndexError) as e:
+        raise ValueError(f"Malformed column: {e}")
+    return [dict(zip(COLUMNS, values)) for values in zip(*columns)]
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from typing import List
+
+from config.ingest import (INGEST_WRITE_BEHIND, INGEST_QUEUE_DIR, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL,
+                           INGEST_SEGMENT_BYTES, INGEST_RETRY_BACKOFF)
+from schemas.sensor_schema import MoistureDataSchema
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def _segment_name(number: int) -> str:
+    return f"segment-{number:08d}.log"
+
+
+def _default_writer(sensors: List[MoistureDataSchema]):
+    from services.sensor_service import get_service
+    return get_service().bulk_receive_moisture_data(sensors)
+
+
+class IngestQueue:
+    """
+    Durable write-behind queue for sensor batches.
+
+    append() writes one JSON line per request ({"t": enqueue time, "rows": [...]}) to
+    the current log segment and fsyncs it before returning, so an accepted batch
+    survives a crash. A flusher thread takes records in order, coalescing rows from
+    many requests into one bulk ingest of up to flush_rows rows, and flushes at the
+    latest flush_interval seconds after the oldest pending record arrived. After a
+    successful write it records its position in checkpoint.json and deletes consumed
+    segments. Records after the checkpoint are replayed on restart; ingest is
+    idempotent on (deviceid, readingid), so a replay after a crash only yields
+    duplicates that are skipped.
+    """
+
+    def __init__(self, directory=INGEST_QUEUE_DIR, flush_rows=INGEST_FLUSH_ROWS,
+                 flush_interval=INGEST_FLUSH_INTERVAL, segment_bytes=INGEST_SEGMENT_BYTES,
+                 retry_backoff=INGEST_RETRY_BACKOFF, writer=_default_writer):
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.retry_backoff = retry_backoff
+        self.writer = writer
+        self.cond = threading.Condition()
+        self.pending = deque()  # (enqueued_at, segment, start, end, rows) per record, oldest first
+        self.pending_rows = 0
+        self.stopping = False
+        self.thread = None
+        self.metrics = {"appended_rows": 0, "flushed_rows": 0, "duplicate_rows": 0, "rejected_rows": 0,
+                        "flushes": 0, "failed_flushes": 0, "last_flush_rows": 0, "last_flush_seconds": None,
+                        "last_error": None}
+        os.makedirs(directory, exist_ok=True)
+        self.checkpoint = self._load_checkpoint()
+        self._recover()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, _segment_name(segment))
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as f:
+                state = json.load(f)
+            return state["segment"], state["offset"]
+        except FileNotFoundError:
+            return 0, 0
+
+    def _save_checkpoint(self, segment: int, offset: int):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _recover(self):
+        # Rebuild the pending index from the segments after the checkpoint and cut off a
+        # torn final line left by a crash mid-append.
+        segments = sorted(int(name[8:16]) for name in os.listdir(self.directory)
+                          if name.startswith("segment-") and name.endswith(".log"))
+        start_segment, start_offset = self.checkpoint
+        for segment in segments:
+            if segment < start_segment:
+                os.remove(self._path(segment))
+                continue
+            offset = start_offset if segment == start_segment else 0
+            with open(self._path(segment), "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line)
+                    self.pending.append((record["t"], segment, offset, offset + len(line), len(record["rows"])))
+                    self.pending_rows += len(record["rows"])
+                    offset += len(line)
+            if os.path.getsize(self._path(segment)) != offset and segment == segments[-1]:
+                with open(self._path(segment), "r+b") as f:
+                    f.truncate(offset)
+        self.segment = segments[-1] if segments and segments[-1] >= start_segment else start_segment
+        self.fd = os.open(self._path(self.segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.size = os.fstat(self.fd).st_size
+
+    def append(self, sensors: List[MoistureDataSchema]) -> int:
+        rows = [sensor.model_dump(mode="json") for sensor in sensors]
+        line = (json.dumps({"t": time.time(), "rows": rows}, separators=(",", ":")) + "\n").encode()
+        with self.cond:
+            if self.size and self.size + len(line) > self.segment_bytes:
+                os.close(self.fd)
+                self.segment += 1
+                self.fd = os.open(self._path(self.segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                self.size = 0
+            os.write(self.fd, line)
+            os.fsync(self.fd)
+            self.pending.append((time.time(), self.segment, self.size, self.size + len(line), len(rows)))
+            self.size += len(line)
+            self.pending_rows += len(rows)
+            self.metrics["appended_rows"] += len(rows)
+            self.cond.notify()
+        return len(rows)
+
+    def _take(self):
+        # Wait until a flush is due, then return the leading records to write (still pending).
+        with self.cond:
+            while True:
+                if self.pending:
+                    wait = self.pending[0][0] + self.flush_interval - time.time()
+                    if self.stopping or self.pending_rows >= self.flush_rows or wait <= 0:
+                        break
+                elif self.stopping:
+                    return []
+                else:
+                    wait = None
+                self.cond.wait(wait)
+            records, rows = [], 0
+            for record in self.pending:
+                if records and rows + record[4] > self.flush_rows:
+                    break
+                records.append(record)
+                rows += record[4]
+            return records
+
+    def _read(self, records) -> List[MoistureDataSchema]:
+        sensors, handles = [], {}
+        try:
+            for _, segment, start, end, _ in records:
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(self._path(segment), "rb")
+                f.seek(start)
+                sensors.extend(MoistureDataSchema(**row) for row in json.loads(f.read(end - start))["rows"])
+        finally:
+            for f in handles.values():
+                f.close()
+        return sensors
+
+    def flush_once(self) -> bool:
+        records = self._take()
+        if not records:
+            return False
+        started = time.monotonic()
+        try:
+            result = self.writer(self._read(records))
+        except Exception as e:
+            result = {"status": "error", "error": f"Unexpected error: {e}"}
+        if result.get("status") != "success":
+            with self.cond:
+                self.metrics["failed_flushes"] += 1
+                self.metrics["last_error"] = result.get("error")
+            print(f"Ingest queue flush failed, retrying: {result.get('error')}")
+            if not self.stopping:
+                time.sleep(self.retry_backoff)
+            return False
+        _, segment, _, end, _ = records[-1]
+        self._save_checkpoint(segment, end)
+        with self.cond:
+            previous = self.checkpoint[0]
+            for _ in records:
+                self.pending.popleft()
+            rows = sum(record[4] for record in records)
+            self.pending_rows -= rows
+            self.checkpoint = (segment, end)
+            self.metrics["flushes"] += 1
+            self.metrics["flushed_rows"] += rows
+            self.metrics["duplicate_rows"] += result.get("duplicates", 0)
+            self.metrics["rejected_rows"] += len(result.get("rejected", []))
+            self.metrics["last_flush_rows"] = rows
+            self.metrics["last_flush_seconds"] = round(time.monotonic() - started, 4)
+            self.metrics["last_error"] = None
+        for old in range(previous, segment):
+            try:
+                os.remove(self._path(old))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def run(self):
+        while True:
+            flushed = self.flush_once()
+            with self.cond:
+                # On shutdown, drain while flushes succeed; anything left stays on disk.
+                if self.stopping and (not self.pending or not flushed):
+                    return
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="ingest-flusher", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=30.0):
+        # Flush what is pending (or give up after timeout; it stays on disk) and stop.
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        with self.cond:
+            os.close(self.fd)
+
+    def stats(self) -> dict:
+        with self.cond:
+            oldest = self.pending[0][0] if self.pending else None
+            return dict(self.metrics, depth_rows=self.pending_rows, depth_requests=len(self.pending),
+                        flush_lag_seconds=round(time.time() - oldest, 3) if oldest else 0.0,
+                        checkpoint={"segment": self.checkpoint[0], "offset": self.checkpoint[1]})
+
+
+ingest_queue = IngestQueue() if INGEST_WRITE_BEHIND else None
+
+
+def get_ingest_queue():
+    return ingest_queue
@@ -0,0 +1,147 @@
+import threading
+from datetime import datetime, timedelta
+
+from config.partitions import (PARTITION_MAINTENANCE, PARTITION_INTERVAL, PARTITION_PREMAKE,
+                               SENSORSDATA_RETENTION_DAYS, PARTITION_CHECK_INTERVAL, PARTITION_LOCK_TIMEOUT)
+from dal.partition_dal import PartitionDAL
+
+
+def period_start(moment: datetime, interval: str) -> datetime:
+    # Start of the month, or of the ISO week (Monday), containing moment.
+    day = datetime(moment.year, moment.month, moment.day)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown partition interval {interval!r}; expected 'month' or 'week'")
+
+
+def next_boundary(moment: datetime, interval: str) -> datetime:
+    # First period start strictly after moment.
+    start = period_start(moment, interval)
+    if interval == "week":
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def plan_partitions(partitions, now: datetime, interval: str, premake: int):
+    """
+    Ranges [lower, upper) to create so that partitions cover up to premake periods
+    past the current one. New ranges start where the last existing partition ends, so
+    they never overlap, and a gap left while maintenance was not running is filled.
+    A range may be shorter than a period when the interval setting changes.
+    """
+    target = period_start(now, interval)
+    for _ in range(premake + 1):
+        target = next_boundary(target, interval)
+    uppers = [upper for _, _, upper in partitions if upper is not None]
+    if any(upper is None for _, _, upper in partitions):
+        return []  # A partition already extends to MAXVALUE
+    start = max(uppers) if uppers else period_start(now, interval)
+    ranges = []
+    while start < target:
+        upper = next_boundary(start, interval)
+        ranges.append((start, upper))
+        start = upper
+    return ranges
+
+
+def partition_name(lower: datetime) -> str:
+    return f"sensorsdata_p{lower:%Y%m%d}"
+
+
+class PartitionMaintenance:
+    """
+    Keeps sensorsdata partitioned by time: creates partitions ahead of the clock and,
+    with a retention set, drops those lying wholly before now - retention_days. A
+    dropped partition is a catalog change, not a row-by-row delete, so retention costs
+    the same at any table size. Runs in a background thread every check_interval
+    seconds; across server processes an advisory lock lets one of them do the work.
+    """
+
+    def __init__(self, interval=PARTITION_INTERVAL, premake=PARTITION_PREMAKE,
+                 retention_days=SENSORSDATA_RETENTION_DAYS, check_interval=PARTITION_CHECK_INTERVAL,
+                 lock_timeout=PARTITION_LOCK_TIMEOUT, dal_factory=PartitionDAL):
+        period_start(datetime.now(), interval)  # Reject a bad interval at startup
+        self.interval = interval
+        self.premake = premake
+        self.retention_days = retention_days
+        self.check_interval = check_interval
+        self.lock_timeout = lock_timeout
+        self.dal_factory = dal_factory
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_run = None
+
+    def run_once(self, now: datetime = None) -> dict:
+        now = now or datetime.now()
+        result = {"time": now.isoformat(timespec="seconds"), "created": [], "dropped": [],
+                  "moved_from_default": 0, "pruned_from_default": 0, "errors": []}
+        dal = self.dal_factory(self.lock_timeout)
+        try:
+            if not dal.is_partitioned():
+                result["status"] = "skipped: sensorsdata is not partitioned"
+            elif not dal.try_lock():
+                result["status"] = "skipped: maintenance running in another process"
+            else:
+                partitions, default = dal.list_partitions()
+                for lower, upper in plan_partitions(partitions, now, self.interval, self.premake):
+                    name = partition_name(lower)
+                    try:
+                        result["moved_from_default"] += dal.create_partition(name, lower, upper, default)
+                        result["created"].append(name)
+                    except Exception as e:
+                        result["errors"].append(f"create {name}: {e}")
+                        break  # Later ranges must not leave a gap behind this one
+                if self.retention_days > 0:
+                    cutoff = now - timedelta(days=self.retention_days)
+                    for name, _, upper in partitions:
+                        if upper is not None and upper <= cutoff:
+                            try:
+                                dal.drop_partition(name)
+                                result["dropped"].append(name)
+                            except Exception as e:
+                                result["errors"].append(f"drop {name}: {e}")
+                    if default:
+                        try:
+                            result["pruned_from_default"] = dal.prune_default(default, cutoff)
+                        except Exception as e:
+                            result["errors"].append(f"prune {default}: {e}")
+                result["status"] = "error" if result["errors"] else "success"
+        except Exception as e:
+            result["status"] = "error"
+            result["errors"].append(str(e))
+        finally:
+            try:
+                dal.release()
+            except Exception as e:
+                print(f"Partition maintenance could not release its connection: {e}")
+        if result["created"] or result["dropped"] or result["errors"]:
+            print(f"Partition maintenance: {result}")
+        self.last_run = result
+        return result
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.run_once()
+            self.stop_event.wait(self.check_interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="partition-maintenance", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=30.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"interval": self.interval, "premake": self.premake, "retention_days": self.retention_days,
+                "last_run": self.last_run}
+
+
+partition_maintenance = PartitionMaintenance() if PARTITION_MAINTENANCE else None
+
+
+def get_partition_maintenance():
+    return partition_maintenance
@@ -1,7 +1,8 @@
 from repository.sensor_repository import SensorRepository
 from dal.sensor_dal import SensorDAL
 from schemas.sensor_schema import MoistureDataSchema
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
 
 class SensorService:
@@ -11,6 +12,10 @@ class SensorService:
     def receive_moisture_data(self, sensors: List[MoistureDataSchema]):
         print("Sensor Service called!!!")
         return self.repository.add_moisture_data(sensors)
+
+    def bulk_receive_moisture_data(self, sensors: List[MoistureDataSchema]):
+        # COPY-based path for device batches; acknowledges with a count and max id.
+        return self.repository.bulk_add_moisture_data(sensors)
     
     def get_sensor_data(self):
         return self.repository.get_sensor_data()
@@ -21,14 +26,16 @@ class SensorService:
     def get_sensor_data_by_username(self, username: str):
         return self.repository.get_sensor_data_by_username(username)
     
-    def get_sensor_data_details_by_sensorid_and_deviceid(self, sensorid: str, deviceid: str):
-        return self.repository.get_sensor_data_details_by_sensorid_and_deviceid(sensorid, deviceid)
+    def get_sensor_data_details_by_sensorid_and_deviceid(self, sensorid: str, deviceid: str,
+                                                         since: Optional[datetime] = None,
+                                                         until: Optional[datetime] = None):
+        return self.repository.get_sensor_data_details_by_sensorid_and_deviceid(sensorid, deviceid, since, until)
 
-    def update_sensor_data(self, reading_id: str, update_data: dict):
-        return self.repository.update_sensor_data(reading_id, update_data)
+    def update_sensor_data(self, reading_id: str, deviceid: str, update_data: dict):
+        return self.repository.update_sensor_data(reading_id, deviceid, update_data)
 
-    def delete_sensor_data(self, reading_data: str):
-        return self.repository.delete_sensor_data(reading_data)
+    def delete_sensor_data(self, reading_data: str, deviceid: str):
+        return self.repository.delete_sensor_data(reading_data, deviceid)
 
     def add_sensor_data(self, sensor_data: dict):
         return self.repository.add_sensor_data(sensor_data)
@@ -37,8 +44,8 @@ class SensorService:
     #     # Add any additional processing logic here (e.g., alerts if moisture < threshold)
     #     return create_moisture_data(db, data)
 
-    def get_last_status(self, sensorid: str, deviceid: str):
-        return self.repository.get_last_status(sensorid, deviceid)
+    def get_last_status(self, sensorid: str, deviceid: str, since: Optional[datetime] = None):
+        return self.repository.get_last_status(sensorid, deviceid, since)
 
     def get_sensor_id_by_device_id(self, deviceid: str):
         return self.repository.get_sensor_id_by_device_id(deviceid)
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+# Per-cycle SQLite write cost: the old path (one INSERT and commit per sensor on a
+# default rollback-journal connection) against database.BatchWriter on a
+# database.connect() connection (WAL, synchronous=NORMAL, one transaction per cycle).
+# Run it on the storage the device writes to; the fsyncs are most of the difference.
+#
+#   python bench/bench_db_writes.py [--dir /path/on/sd-card] [--cycles 300] [--sensors 4]
+
+RECORD = ("dev-1", 1, 12000.0, 53.3, "Wet", 20.1, 55.0, 300.0, 4.2, "Stockton", "2026-10-17 10:00:00", None)
+
+
+def fresh(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def per_row(path, cycles, sensors):
+    conn = sqlite3.connect(path)
+    database.setup_database(conn)
+    start = time.perf_counter()
+    for _ in range(cycles):
+        for sensor_id in range(1, sensors + 1):
+            database.save_record(conn, RECORD[:1] + (sensor_id,) + RECORD[2:])
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def batched(path, cycles, sensors):
+    conn = database.connect(path)
+    database.setup_database(conn)
+    writer = database.BatchWriter(conn, flush_cycles=1)
+    start = time.perf_counter()
+    for _ in range(cycles):
+        for sensor_id in range(1, sensors + 1):
+            writer.add(RECORD[:1] + (sensor_id,) + RECORD[2:])
+        writer.end_cycle()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default=None, help="directory for the benchmark database (default: a temp dir)")
+    parser.add_argument("--cycles", type=int, default=300)
+    parser.add_argument("--sensors", type=int, default=4)
+    args = parser.parse_args()
+    directory = args.dir or tempfile.mkdtemp()
+    path = os.path.join(directory, "bench_db_writes.db")
+    for label, run, commits in (("per-row", per_row, args.sensors), ("batched+WAL", batched, 1)):
+        fresh(path)
+        elapsed = run(path, args.cycles, args.sensors)
+        print(f"{label:12s} {elapsed / args.cycles * 1000:7.3f} ms/cycle  {commits} commit(s)/cycle")
+    fresh(path)
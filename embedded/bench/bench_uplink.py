@@ -0,0 +1,116 @@
+import os
+import ssl
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import uplink
+
+# Upload throughput from a SQLite backlog to a local stub backend (HTTP/1.1
+# keep-alive, answers 200 to every batch). Compares the old per-batch path (batch
+# written to payload.json and posted by a forked curl) with UplinkClient's reused
+# session, with and without gzip. Batches are a fixed 20 rows of JSON, and the
+# watermark is committed after every batch in all modes.
+#
+#   python bench/bench_uplink.py [--rows 10000] [--modes curl,session,gzip]
+#                                [--tls cert.pem key.pem]
+#
+# With --tls the stub serves HTTPS, so each curl call pays a full TLS handshake as on
+# the device; point REQUESTS_CA_BUNDLE and CURL_CA_BUNDLE at the certificate. A
+# self-signed pair: openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=localhost
+#   -addext subjectAltName=DNS:localhost
+#   -keyout key.pem -out cert.pem
+
+ROW = ("2026-10-17 12:00:00", "dev-1", 1, 12000.0, 53.3, "Wet", 21.5, 60.0, 300.0, 3.2, "Stockton",
+       "2026-10-17 11:00:00", None)
+BATCH_ROWS = 20
+
+
+class StubBackend(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # Status, headers and body in one write: split writes meet delayed ACK and
+        # stall every keep-alive request by ~40 ms, which is the stub, not the client.
+        body = b'{"status":"success"}'
+        self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(tls):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBackend)
+    scheme = "http"
+    if tls:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*tls)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://localhost:{server.server_address[1]}/api/send-data"
+
+
+def make_backlog(path, rows):
+    conn = database.connect(path)
+    database.setup_database(conn)
+    for start in range(0, rows, 10000):
+        database.save_records(conn, [ROW] * min(10000, rows - start))
+    return conn
+
+
+def post_with_curl(url, data, payload_file):
+    # The pre-session upload path: one file write and one curl process per batch.
+    with open(payload_file, "w") as f:
+        json.dump({"data": data}, f)
+    result = subprocess.run(["curl", "--silent", "--show-error", "--write-out", "%{http_code}",
+                             "--output", os.devnull, "--request", "POST", url,
+                             "--header", "Content-Type: application/json", "--data", f"@{payload_file}"],
+                            capture_output=True, text=True)
+    return result.returncode == 0 and result.stdout.strip() == "200"
+
+
+def run(mode, conn, url, workdir):
+    with conn:
+        conn.execute("DELETE FROM uplink_outbox")
+        conn.execute("DELETE FROM uplink_acked")
+    batcher = uplink.AdaptiveBatcher(initial=BATCH_ROWS, minimum=BATCH_ROWS, maximum=BATCH_ROWS)
+    start = time.perf_counter()
+    if mode == "curl":
+        payload_file = os.path.join(workdir, "payload.json")
+        for batch in uplink.unsent_batches(conn, batcher):
+            if not post_with_curl(url, batch, payload_file):
+                return False, time.perf_counter() - start
+            uplink.mark_sent(conn, batch[-1]["id"])
+        ok = True
+    else:
+        client = uplink.UplinkClient(use_gzip=(mode == "gzip"), wire_format="json", pool_size=1)
+        ok = uplink.send_unsent_rows(conn, url, client, batcher)
+        client.close()
+    return ok, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--modes", default="curl,session,gzip")
+    parser.add_argument("--tls", nargs=2, metavar=("CERT", "KEY"))
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    server, url = start_stub(args.tls)
+    conn = make_backlog(os.path.join(workdir, "bench_uplink.db"), args.rows)
+    for mode in args.modes.split(","):
+        ok, elapsed = run(mode, conn, url, workdir)
+        sent = uplink.get_last_sent_id(conn)
+        print(f"{mode:8s} rows={sent:>8} ok={ok} {elapsed:8.2f}s {sent / elapsed:10.0f} rows/s")
+    conn.close()
+    server.shutdown()
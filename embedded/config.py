@@ -1,25 +1,103 @@
 # Central configuration and device serial extraction
+import os
 
 # Time intervals (in seconds)
 SENSOR_READ_INTERVAL = 60         # 15 minutes between sensor readings
 DATA_RETENTION_DAYS = 7            # Days to retain data in the database
-WEATHER_FETCH_INTERVAL = 900       # 15 minutes between weather API calls
+WEATHER_FETCH_INTERVAL = 3 * 3600  # 3 hours between weather API calls (readings interpolate the forecast)
+WEATHER_RETRY_INTERVAL = 60        # Seconds before retrying a failed weather fetch
+WEATHER_PAST_HOURS = 1             # Hourly forecast window fetched around now
+WEATHER_FORECAST_HOURS = 12
+WEATHER_CACHE_TTL = WEATHER_FORECAST_HOURS * 3600  # Cached weather older than this is not attached to readings
+WEATHER_CACHE_FILE = "weather_cache.json"
+LOCATION_CACHE_FILE = "location_cache.json"
+LOCATION_CACHE_TTL = 7 * 24 * 3600  # Re-resolve the device location weekly
+LOCATION_RETRY_INTERVAL = 300      # Seconds before retrying a failed location lookup
+LOCATION_LOOKUP_TIMEOUT = 10       # Per-provider HTTP timeout; providers are queried in parallel
 
 # ADC conversion settings
 MIN_ADC = 5000                   # ADC value corresponding to 100% moisture
 MAX_ADC = 20000                  # ADC value corresponding to 0% moisture
 
+# Sensor hardware settings
+SENSOR_BACKEND = os.getenv("SENSOR_BACKEND", "hardware")  # "hardware" or "simulated"
+ADC_DATA_RATE = 475                # ADS1115 samples/s (8, 16, 32, 64, 128, 250, 475, 860)
+SENSOR_CYCLE_BUDGET = 5.0          # Max seconds spent reading sensors per cycle
+OVERSAMPLE_COUNT = 1               # ADC samples per channel per reading (1 disables oversampling)
+OVERSAMPLE_REDUCER = "median"      # "median" or "trimmed_mean"
+OVERSAMPLE_TRIM = 0.2              # Fraction trimmed from each end for trimmed_mean and the variance
+ADAPTIVE_SAMPLING = False          # Per-sensor read interval follows how fast moisture changes
+SAMPLING_MIN_INTERVAL = 15         # Fastest per-sensor interval (seconds); also the sampler's tick
+SAMPLING_MAX_INTERVAL = 900        # Slowest per-sensor interval (seconds) for flat readings
+SAMPLING_BOUNDS = {}               # Per-sensor (min, max) interval overrides, e.g. {2: (30, 1800)}
+SAMPLING_TARGET_DELTA = 0.5        # Moisture change (percentage points) aimed for between readings
+SAMPLING_NOISE_FLOOR = 0.3         # Changes up to this much are treated as ADC noise, not movement
+# One entry per ADS1115 board (addresses 0x48-0x4B). Sensor ids are assigned in
+# board/channel order starting at 1, so the first board keeps ids 1-4.
+SENSOR_BOARDS = [
+    {"address": 0x48, "channels": [
+        {"channel": 0, "digital": 14, "active": True},
+        {"channel": 1, "digital": 15, "active": True},
+        {"channel": 2, "digital": 18, "active": True},
+        {"channel": 3, "digital": 23, "active": True},
+    ]},
+]
+
 # CSV output settings
 ENABLE_CSV_OUTPUT = True
 CSV_FILENAME = "plant_data_temp.csv"
+CSV_ROTATE_DAILY = True            # Start a new CSV file each day
+CSV_ROTATE_MAX_BYTES = 5 * 1024 * 1024    # Rotate early once the current file reaches this size
+CSV_GZIP_ROTATED = True            # Compress rotated files
+CSV_MAX_TOTAL_BYTES = 50 * 1024 * 1024    # Oldest rotated files are deleted beyond this total
 
 # Database settings
 DB_NAME = "plant_sensor_data.db"
+DB_BATCH_CYCLES = 1                # Sampling cycles buffered before one batched commit
+DB_SYNCHRONOUS = "NORMAL"          # SQLite synchronous pragma (NORMAL is durable enough with WAL)
+DB_BUSY_TIMEOUT_MS = 5000          # How long a connection waits on a locked database
+
+# Retention settings (old rows are pruned on their own cadence, in bounded chunks)
+RETENTION_INTERVAL = 3600          # Seconds between retention passes
+RETENTION_CHUNK_ROWS = 500         # Rows deleted per transaction
+RETENTION_TIME_BUDGET = 0.5        # Max seconds a retention pass may spend deleting
+RETENTION_VACUUM_PAGES = 256       # Free pages returned to the filesystem per pass
+
+# Rollup settings (hourly/daily moisture aggregates outlive the raw rows)
+ROLLUP_HOURLY_RETENTION_DAYS = 90  # Days of hourly min/max/mean/count kept
+ROLLUP_DAILY_RETENTION_DAYS = 730  # Days of daily aggregates kept
+ROLLUP_QUERY_LIMIT = 5000          # Max aggregates returned by one /rollups request
 
 # Backend API endpoints – for auto-sending data and for on-demand (current) data.
 BACKEND_API_SEND_DATA = "https://dev.sprout-ly.com/api/send-data"
 BACKEND_API_SEND_CURRENT = "https://dev.sprout-ly.com/api/send-current"
 
+# Device runtime: local HTTP API (/send-data, /send-current) and the periodic uplink worker
+DEVICE_API_HOST = "0.0.0.0"
+DEVICE_API_PORT = 5001
+UPLINK_INTERVAL = SENSOR_READ_INTERVAL   # Seconds between automatic uploads of unsent rows
+UPLINK_TIMEOUT = 30               # Per-request timeout for batch uploads (seconds)
+UPLINK_GZIP = True                # Gzip request bodies (the backend decodes Content-Encoding: gzip)
+UPLINK_GZIP_MIN_BYTES = 1024      # Smaller bodies are sent uncompressed
+UPLINK_PAGE_ROWS = 500            # Unsent rows read from SQLite per keyset page
+UPLINK_BATCH_INITIAL = 20         # Rows per upload batch at startup; adapted from response times
+UPLINK_BATCH_MIN = 5
+UPLINK_BATCH_MAX = 1000
+UPLINK_MAX_PAYLOAD_BYTES = 256 * 1024  # Cap on a batch's uncompressed JSON body
+UPLINK_FAST_RESPONSE = 2.0        # Successful responses faster than this (seconds) grow the batch
+UPLINK_FORMAT = "columnar"        # "columnar" (msgpack, falls back to JSON if unsupported) or "json"
+UPLINK_COLUMNAR_RETRY = 3600      # Seconds on JSON after the backend turns columnar away, before trying it again
+UPLINK_DEADBAND = False           # Upload only readings that changed (see uplink.DeadbandFilter); all stay in SQLite
+UPLINK_DEADBAND_DEFAULT = 0.5     # Moisture change (percentage points) that triggers an upload
+UPLINK_DEADBAND_BY_SENSOR = {}    # Per-sensor thresholds, e.g. {1: 1.0, 3: 0.25}
+UPLINK_HEARTBEAT = 3600           # Upload at least one reading per sensor this often (seconds)
+UPLINK_WINDOW = 4                 # Batches in flight at once; the watermark only passes acked prefixes
+SEND_JOB_HISTORY = 50             # Finished /send-data and /send-current jobs kept for /send-status
+
+# Cycle timing
+CYCLE_TIMING_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 15)  # Histogram bucket upper bounds (seconds)
+CYCLE_TIMING_LOG_EVERY = 60      # Log a timing summary every N sampling cycles (0 disables)
+
 # Retry settings for sending data
 RETRY_ATTEMPTS = 3
 BASE_DELAY = 2
@@ -0,0 +1,83 @@
+import time
+import bisect
+from contextlib import contextmanager
+
+from config import SENSOR_READ_INTERVAL, CYCLE_TIMING_BUCKETS
+
+class IntervalSchedule:
+    """
+    Deadlines on time.monotonic() aligned to multiples of the interval from start.
+    Work time does not push later readings back; if a cycle runs past one or more
+    deadlines, those slots are skipped and counted as overruns rather than bunched up.
+    """
+
+    def __init__(self, interval=SENSOR_READ_INTERVAL, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.start = clock()
+        self.cycle = 0
+        self.overruns = 0
+        self.skipped = 0
+
+    def next_deadline(self):
+        return self.start + (self.cycle + 1) * self.interval
+
+    def advance(self):
+        # Move to the next slot and return the seconds to wait for it (never negative).
+        now = self.clock()
+        self.cycle += 1
+        deadline = self.start + self.cycle * self.interval
+        if now > deadline:
+            missed = int((now - deadline) // self.interval) + 1
+            self.overruns += 1
+            self.skipped += missed
+            self.cycle += missed
+            deadline = self.start + self.cycle * self.interval
+        return max(0.0, deadline - now)
+
+    def lateness(self):
+        # Seconds since the current slot's deadline; how late this cycle started.
+        return max(0.0, self.clock() - (self.start + self.cycle * self.interval))
+
+class PhaseHistogram:
+    """Fixed-bucket histogram of durations per named phase, plus count/sum/max."""
+
+    def __init__(self, buckets=CYCLE_TIMING_BUCKETS, clock=time.monotonic):
+        self.buckets = tuple(sorted(buckets))
+        self.clock = clock
+        self.phases = {}
+
+    def observe(self, phase, seconds):
+        stats = self.phases.get(phase)
+        if stats is None:
+            # Last slot counts durations above the largest bucket.
+            stats = self.phases[phase] = {"counts": [0] * (len(self.buckets) + 1),
+                                          "count": 0, "sum": 0.0, "max": 0.0}
+        stats["counts"][bisect.bisect_left(self.buckets, seconds)] += 1
+        stats["count"] += 1
+        stats["sum"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+
+    @contextmanager
+    def time(self, phase):
+        t0 = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(phase, self.clock() - t0)
+
+    def report(self):
+        labels = [f"le_{b:g}" for b in self.buckets] + ["inf"]
+        return {
+            phase: {
+                "count": s["count"],
+                "avg_ms": round(s["sum"] / s["count"] * 1000, 3) if s["count"] else None,
+                "max_ms": round(s["max"] * 1000, 3),
+                "buckets": dict(zip(labels, s["counts"])),
+            }
+            for phase, s in self.phases.items()
+        }
+
+    def summary(self):
+        return ", ".join(f"{phase}: avg {r['avg_ms']}ms max {r['max_ms']}ms"
+                         for phase, r in self.report().items())
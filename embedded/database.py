@@ -1,9 +1,53 @@
 import sqlite3
-from config import DB_NAME, DATA_RETENTION_DAYS
+from config import DB_NAME, DB_BATCH_CYCLES, DB_SYNCHRONOUS, DB_BUSY_TIMEOUT_MS
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
+import rollups
+
+INSERT_RECORD_SQL = """
+    INSERT INTO moisture_data
+    (device_id, sensor_id, adc_value, moisture_level, digital_status,
+     weather_temp, weather_humidity, weather_sunlight, weather_wind_speed,
+     location, weather_fetched, adc_variance)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_TIMESTAMPED_RECORD_SQL = """
+    INSERT INTO moisture_data
+    (timestamp, device_id, sensor_id, adc_value, moisture_level, digital_status,
+     weather_temp, weather_humidity, weather_sunlight, weather_wind_speed,
+     location, weather_fetched, adc_variance)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def configure_connection(conn):
+    # WAL lets send_data_api read while the sampler writes, and with synchronous=NORMAL
+    # a commit only appends to the WAL; fsyncs happen at checkpoints instead of per row.
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+    mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()
+    if not mode or mode[0].lower() != "wal":
+        logging.warning(f"Could not enable WAL journaling, journal_mode is {mode}")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+
+def connect(db_name=DB_NAME):
+    # Open a connection with the shared pragmas applied.
+    conn = sqlite3.connect(db_name, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    configure_connection(conn)
+    return conn
+
+def enable_incremental_vacuum(conn):
+    # auto_vacuum only takes effect on an empty database or after a full VACUUM,
+    # so existing files are rebuilt once; afterwards freed pages can be reclaimed
+    # a few at a time with PRAGMA incremental_vacuum.
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == 2:
+        return
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    logging.info("Enabled incremental auto-vacuum on the database.")
 
 def setup_database(conn):
+    enable_incremental_vacuum(conn)
     cursor = conn.cursor()
     # Create table with device_id before sensor_id
     cursor.execute("""
@@ -20,7 +64,8 @@ def setup_database(conn):
             weather_sunlight REAL,
             weather_wind_speed REAL,
             location TEXT,
-            weather_fetched TEXT
+            weather_fetched TEXT,
+            adc_variance REAL
         )
     """)
     conn.commit()
@@ -45,23 +90,85 @@ def setup_database(conn):
         conn.commit()
     except sqlite3.OperationalError:
         pass
+    try:
+        cursor.execute("ALTER TABLE moisture_data ADD COLUMN adc_variance REAL")
+        conn.commit()
+    except sqlite3.OperationalError:
+        pass
+    # Retention prunes by timestamp; without this index every pass scans the table.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_moisture_data_timestamp ON moisture_data (timestamp)")
+    # Uplink outbox: the sent watermark (single row) and batches acked ahead of it.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS uplink_outbox (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_sent_id INTEGER NOT NULL,
+            filter_state TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS uplink_acked (
+            first_id INTEGER NOT NULL,
+            last_id INTEGER PRIMARY KEY,
+            filter_state TEXT
+        )
+    """)
+    for table in ("uplink_outbox", "uplink_acked"):
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN filter_state TEXT")
+        except sqlite3.OperationalError:
+            pass
+    conn.commit()
+    rollups.setup(conn)
 
 def save_record(conn, record):
     # Record order: (device_id, sensor_id, adc_value, moisture_level, digital_status,
-    # weather_temp, weather_humidity, weather_sunlight, weather_wind_speed, location, weather_fetched)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO moisture_data 
-        (device_id, sensor_id, adc_value, moisture_level, digital_status,
-         weather_temp, weather_humidity, weather_sunlight, weather_wind_speed,
-         location, weather_fetched)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, record)
-    conn.commit()
+    # weather_temp, weather_humidity, weather_sunlight, weather_wind_speed, location, weather_fetched,
+    # adc_variance)
+    save_records(conn, [(datetime.now().strftime("%Y-%m-%d %H:%M:%S"),) + tuple(record)])
 
-def delete_old_records(conn):
-    cutoff_date = datetime.now() - timedelta(days=DATA_RETENTION_DAYS)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM moisture_data WHERE timestamp < ?",
-                   (cutoff_date.strftime("%Y-%m-%d %H:%M:%S"),))
-    conn.commit()
+def save_records(conn, records):
+    # Insert many timestamped records with one executemany in a single transaction,
+    # together with their rollup updates. Each record is (timestamp, *save_record order).
+    if not records:
+        return 0
+    with conn:
+        conn.executemany(INSERT_TIMESTAMPED_RECORD_SQL, records)
+        rollups.update(conn, records)
+    return len(records)
+
+class BatchWriter:
+    """
+    Buffers records for one or more sampling cycles and writes them in one transaction.
+    Records are stamped when they are added, so buffering does not shift their timestamps.
+    """
+
+    def __init__(self, conn, flush_cycles=DB_BATCH_CYCLES):
+        self.conn = conn
+        self.flush_cycles = max(1, int(flush_cycles))
+        self.pending = []
+        self.cycles = 0
+
+    def add(self, record, timestamp=None):
+        ts = timestamp or datetime.now()
+        self.pending.append((ts.strftime("%Y-%m-%d %H:%M:%S"),) + tuple(record))
+
+    def end_cycle(self):
+        # Close a sampling cycle; flush once enough cycles are buffered.
+        self.cycles += 1
+        if self.cycles >= self.flush_cycles:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        if not self.pending:
+            self.cycles = 0
+            return 0
+        try:
+            written = save_records(self.conn, self.pending)
+        except sqlite3.Error as e:
+            # Keep the buffer so the next flush retries these rows.
+            logging.error(f"Batch write of {len(self.pending)} records failed: {e}")
+            return 0
+        self.pending = []
+        self.cycles = 0
+        return written
@@ -0,0 +1,281 @@
+import sys
+import json
+import signal
+import asyncio
+import logging
+import sqlite3
+from urllib.parse import parse_qs
+
+from config import (DB_NAME, BACKEND_API_SEND_DATA, BACKEND_API_SEND_CURRENT,
+                    DEVICE_API_HOST, DEVICE_API_PORT, UPLINK_INTERVAL, UPLINK_WINDOW, CYCLE_TIMING_LOG_EVERY)
+import cycle_timing
+import database
+import rollups
+import uplink
+
+# Single-process device runtime: the sampling loop, the periodic uplink and the
+# /send-data and /send-current endpoints run as tasks on one asyncio loop. All
+# SQLite access happens on the loop thread through one connection; only blocking
+# work (I2C reads, HTTP posts) is pushed to worker threads.
+
+HTTP_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                500: "Internal Server Error"}
+MAX_REQUEST_BODY = 64 * 1024
+
+class DeviceRuntime:
+    def __init__(self, conn, sampler):
+        self.conn = conn
+        self.sampler = sampler
+        self.stop_event = asyncio.Event()
+        self.send_lock = asyncio.Lock()  # One upload at a time across the worker and both endpoints
+        self.send_task = None  # The running upload, joined by concurrent triggers
+        self.send_url = None
+        self.client = uplink.UplinkClient()  # Keep-alive session reused by every upload
+        self.batcher = uplink.AdaptiveBatcher()  # Batch size adapted to backend response times
+        self.jobs = uplink.SendJobs()  # /send-data and /send-current requests, polled via /send-status
+        self.job_tasks = set()
+        self.stats_routes = {"/cycle-stats": self.cycle_stats, "/uplink-stats": self.batcher.stats,
+                             "/rollups": self.rollup_query, "/send-status": self.jobs.status}
+        self.schedule = None  # cycle_timing.IntervalSchedule, created when sampling starts
+        self.cycles_run = 0
+        self.routes = {
+            "/send-data": (BACKEND_API_SEND_DATA, "Auto-send"),
+            "/send-current": (BACKEND_API_SEND_CURRENT, "Manual-send"),
+        }
+
+    async def sleep(self, seconds):
+        # Sleep that ends early on shutdown; returns True if shutdown was requested.
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self.stop_event.is_set()
+
+    async def post_batch(self, url, data):
+        return data, await asyncio.to_thread(self.client.post_batch, url, data)
+
+    async def send_unsent(self, url, after_str=None, source="Scheduler"):
+        # Single flight: a trigger for the same endpoint while an upload is running
+        # joins it and gets its result instead of queueing a second pass over the
+        # same rows. Triggers with an 'after' reset, or for the other endpoint, wait
+        # their turn.
+        current = self.send_task
+        if current is not None and not current.done() and after_str is None and self.send_url == url:
+            logging.info(f"{source} joined the upload already in progress.")
+            return await asyncio.shield(current)
+        async with self.send_lock:
+            self.send_url = url
+            self.send_task = asyncio.create_task(self.upload(url, after_str, source))
+            return await asyncio.shield(self.send_task)
+
+    async def run_job(self, job):
+        self.jobs.start(job)
+        try:
+            self.jobs.finish(job, await self.send_unsent(job["url"], job["after"], job["source"]))
+        except asyncio.CancelledError:
+            self.jobs.finish(job, False, "cancelled")
+            raise
+        except Exception as e:
+            logging.error(f"Send job {job['id']} failed: {e}")
+            self.jobs.finish(job, False, str(e))
+
+    async def upload(self, url, after_str, source):
+        # Keeps up to UPLINK_WINDOW batches in flight. Acks are applied in send order
+        # (uplink.AckWindow), so the watermark never passes an unacknowledged batch.
+        if after_str:
+            uplink.reset_after(self.conn, after_str, source)
+        window = uplink.AckWindow()
+        in_flight = set()
+        failed = False
+        sent_any = False
+
+        async def collect(return_when):
+            nonlocal in_flight, failed
+            done, in_flight = await asyncio.wait(in_flight, return_when=return_when)
+            for task in done:
+                data, result = task.result()
+                self.batcher.record(len(data), result)
+                if result.ok:
+                    uplink.mark_acked(self.conn, data.first_id, data[-1]["id"], window)
+                else:
+                    failed = True
+
+        try:
+            for data in uplink.unsent_batches(self.conn, self.batcher, uplink.load_deadband(self.conn)):
+                window.add(data[-1]["id"], data.filter_state)
+                in_flight.add(asyncio.create_task(self.post_batch(url, data)))
+                sent_any = True
+                while len(in_flight) >= UPLINK_WINDOW or (in_flight and failed):
+                    await collect(asyncio.FIRST_COMPLETED)
+                if failed:
+                    break
+            if in_flight:
+                await collect(asyncio.ALL_COMPLETED)
+        finally:
+            # On cancellation, abandon outstanding posts; their batches were not acked.
+            for task in in_flight:
+                task.cancel()
+        uplink.advance_over_acked(self.conn)
+        if not sent_any:
+            logging.info("No unsent rows to send.")
+        return not failed
+
+    async def sampler_loop(self):
+        # Readings stay on interval boundaries: the wait is to the next deadline, not a
+        # fixed sleep after however long the cycle took.
+        self.schedule = cycle_timing.IntervalSchedule(self.sampler.interval)
+        timing = self.sampler.timing
+        while not self.stop_event.is_set():
+            timing.observe("start_lag", self.schedule.lateness())
+            try:
+                with timing.time("cycle"):
+                    with timing.time("read"):
+                        results = await asyncio.to_thread(self.sampler.read)
+                    self.sampler.store(results)
+            except Exception as e:
+                logging.error(f"Sampling cycle failed: {e}")
+            overruns = self.schedule.overruns
+            wait = self.schedule.advance()
+            if self.schedule.overruns != overruns:
+                logging.warning(f"Sampling cycle overran its {self.sampler.interval}s interval; "
+                                f"{self.schedule.skipped} slots skipped so far.")
+            self.cycles_run += 1
+            if CYCLE_TIMING_LOG_EVERY and self.cycles_run % CYCLE_TIMING_LOG_EVERY == 0:
+                logging.info(f"Cycle timing after {self.cycles_run} cycles: {timing.summary()}")
+            if await self.sleep(wait):
+                break
+
+    def cycle_stats(self):
+        schedule = self.schedule
+        return {
+            "interval": self.sampler.interval,
+            "cycles": self.cycles_run,
+            "overruns": schedule.overruns if schedule else 0,
+            "skipped": schedule.skipped if schedule else 0,
+            "phases": self.sampler.timing.report(),
+            "sampling": self.sampler.sampling.report() if self.sampler.sampling else None,
+        }
+
+    def rollup_query(self, tier="hourly", since=None, until=None, sensor_id=None):
+        # Long-range aggregates for backfilling gaps that raw retention no longer covers.
+        return {"data": rollups.query(self.conn, tier, since, until, sensor_id)}
+
+    async def uplink_loop(self):
+        logging.info(f"Uplink worker started with interval {UPLINK_INTERVAL} seconds.")
+        while not await self.sleep(UPLINK_INTERVAL):
+            try:
+                await self.send_unsent(BACKEND_API_SEND_DATA)
+            except Exception as e:
+                logging.error(f"Scheduled send failed: {e}")
+
+    async def handle_request(self, method, path, body, query=None):
+        if path in self.stats_routes:
+            if method != "GET":
+                return 405, {"message": "Method not allowed"}
+            params = {k: v[-1] for k, v in parse_qs(query or "").items()}
+            try:
+                return 200, self.stats_routes[path](**params)
+            except (TypeError, ValueError) as e:
+                return 400, {"message": f"Bad request: {e}"}
+            except KeyError:
+                return 404, {"message": "Not found"}
+        if path not in self.routes:
+            return 404, {"message": "Not found"}
+        if method != "POST":
+            return 405, {"message": "Method not allowed"}
+        try:
+            req = json.loads(body) if body else {}
+        except ValueError:
+            req = {}
+        if not isinstance(req, dict):
+            req = {}
+        # Answer at once with a job id; concurrent triggers share one job (uplink.SendJobs).
+        url, source = self.routes[path]
+        job, created = self.jobs.submit(url, req.get("after"), source)
+        if created:
+            task = asyncio.create_task(self.run_job(job))
+            self.job_tasks.add(task)
+            task.add_done_callback(self.job_tasks.discard)
+        return 202, {"message": "Send job accepted", "job_id": job["id"], "status": job["status"],
+                     "status_url": f"/send-status?job_id={job['id']}"}
+
+    async def handle_client(self, reader, writer):
+        # Minimal HTTP/1.1: one request per connection, JSON in and out.
+        try:
+            request_line = await reader.readline()
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                status, payload = 400, {"message": "Bad request"}
+            else:
+                method = parts[0].upper()
+                path, _, query = parts[1].partition("?")
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip() or 0)
+                if length > MAX_REQUEST_BODY:
+                    status, payload = 400, {"message": "Request body too large"}
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.handle_request(method, path, body, query)
+        except Exception as e:
+            logging.error(f"Error handling device API request: {e}")
+            status, payload = 500, {"message": "Internal error"}
+        data = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n")
+        try:
+            writer.write(head.encode("latin-1") + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop_event.set)
+        self.sampler.start()
+        server = await asyncio.start_server(self.handle_client, DEVICE_API_HOST, DEVICE_API_PORT)
+        logging.info(f"Device API listening on {DEVICE_API_HOST}:{DEVICE_API_PORT}")
+        sampler_task = asyncio.create_task(self.sampler_loop())
+        uplink_task = asyncio.create_task(self.uplink_loop())
+        try:
+            await self.stop_event.wait()
+            print("Received shutdown signal...")
+        finally:
+            # Stop taking requests, let the current sampling cycle finish, then
+            # abandon any in-flight upload (its watermark was not advanced).
+            self.stop_event.set()
+            server.close()
+            await server.wait_closed()
+            await sampler_task
+            pending = [uplink_task, *self.job_tasks] + ([self.send_task] if self.send_task else [])
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.client.close()
+            self.sampler.close()
+
+async def main(sampler_factory):
+    try:
+        conn = database.connect(DB_NAME)
+    except sqlite3.Error as e:
+        logging.error(f"Failed to connect to the database: {e}")
+        sys.exit(1)
+    try:
+        database.setup_database(conn)
+        uplink.import_legacy_state(conn)
+        runtime = DeviceRuntime(conn, sampler_factory(conn))
+        await runtime.serve()
+    finally:
+        conn.close()
+
+def run(sampler_factory):
+    asyncio.run(main(sampler_factory))
@@ -0,0 +1,103 @@
+import time
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+
+from config import (DATA_RETENTION_DAYS, RETENTION_INTERVAL, RETENTION_CHUNK_ROWS,
+                    RETENTION_TIME_BUDGET, RETENTION_VACUUM_PAGES)
+import rollups
+
+class RetentionManager:
+    """
+    Prunes moisture_data rows older than DATA_RETENTION_DAYS on its own cadence, and
+    rollup buckets past their tier's retention.
+    Deletes run in small chunks against the timestamp index and stop once the time
+    budget is spent, so a large backlog is worked off over several passes instead of
+    stalling the sampler. Freed pages are handed back with incremental vacuum.
+    """
+
+    def __init__(self, conn, retention_days=DATA_RETENTION_DAYS, interval=RETENTION_INTERVAL,
+                 chunk_rows=RETENTION_CHUNK_ROWS, time_budget=RETENTION_TIME_BUDGET,
+                 vacuum_pages=RETENTION_VACUUM_PAGES):
+        self.conn = conn
+        self.retention_days = retention_days
+        self.interval = interval
+        self.chunk_rows = chunk_rows
+        self.time_budget = time_budget
+        self.vacuum_pages = vacuum_pages
+        self.last_run = None
+        self.totals = {"passes": 0, "rows_deleted": 0, "rollups_deleted": 0, "pages_freed": 0, "seconds": 0.0}
+        self.last_stats = None
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.last_run is None or (now - self.last_run) >= self.interval
+
+    def maybe_run(self, now=None):
+        # Run a pass only when the cadence has elapsed; returns the pass stats or None.
+        now = time.monotonic() if now is None else now
+        if not self.due(now):
+            return None
+        self.last_run = now
+        return self.run()
+
+    def delete_chunk(self, cutoff):
+        with self.conn:
+            cursor = self.conn.execute("""
+                DELETE FROM moisture_data WHERE id IN (
+                    SELECT id FROM moisture_data WHERE timestamp < ?
+                    ORDER BY timestamp LIMIT ?
+                )
+            """, (cutoff, self.chunk_rows))
+        return cursor.rowcount
+
+    def reclaim_pages(self):
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages:
+            # Through execute() the pragma only steps once and frees a single page;
+            # executescript runs it to completion.
+            self.conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+        return page_count - self.conn.execute("PRAGMA page_count").fetchone()[0]
+
+    def run(self):
+        # Delete expired rows in chunks until none are left or the budget is spent.
+        started = time.monotonic()
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+        rows_deleted = 0
+        rollups_deleted = 0
+        pages_freed = 0
+        complete = False
+        try:
+            rollups_deleted = rollups.prune(self.conn)
+            while time.monotonic() - started < self.time_budget:
+                deleted = self.delete_chunk(cutoff)
+                rows_deleted += deleted
+                if deleted < self.chunk_rows:
+                    complete = True
+                    break
+            pages_freed = self.reclaim_pages()
+        except sqlite3.Error as e:
+            logging.error(f"Retention pass failed: {e}")
+        stats = {
+            "rows_deleted": rows_deleted,
+            "rollups_deleted": rollups_deleted,
+            "pages_freed": pages_freed,
+            "seconds": round(time.monotonic() - started, 4),
+            "complete": complete,
+        }
+        self.totals["passes"] += 1
+        self.totals["rows_deleted"] += rows_deleted
+        self.totals["rollups_deleted"] += rollups_deleted
+        self.totals["pages_freed"] += pages_freed
+        self.totals["seconds"] += stats["seconds"]
+        self.last_stats = stats
+        if rows_deleted or rollups_deleted or pages_freed:
+            logging.info(f"Retention pass: {stats}")
+        if not complete:
+            # More expired rows remain; come back on the next cycle rather than next interval.
+            self.last_run = None
+        return stats
+
+    def stats(self):
+        return {"last": self.last_stats, "totals": dict(self.totals)}
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+from config import ROLLUP_HOURLY_RETENTION_DAYS, ROLLUP_DAILY_RETENTION_DAYS, ROLLUP_QUERY_LIMIT
+
+# Per-sensor moisture aggregates kept long after raw rows expire. Each tier stores
+# count/sum/min/max per (bucket, device, sensor); the mean is sum / count. Buckets
+# are prefixes of the raw "YYYY-mm-dd HH:MM:SS" timestamp, so they sort and compare
+# like the timestamps themselves.
+TIERS = {
+    "hourly": ("moisture_hourly", 13, ":00:00", ROLLUP_HOURLY_RETENTION_DAYS),
+    "daily": ("moisture_daily", 10, "", ROLLUP_DAILY_RETENTION_DAYS),
+}
+
+def bucket_of(timestamp, tier):
+    _, length, suffix, _ = TIERS[tier]
+    return timestamp[:length] + suffix
+
+def setup(conn):
+    # WITHOUT ROWID keyed by bucket first: upserts, range queries and pruning all
+    # walk the primary key. A missing device id is stored as ''.
+    for tier, (table, length, suffix, _) in TIERS.items():
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TEXT NOT NULL,
+                device_id TEXT NOT NULL,
+                sensor_id INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                PRIMARY KEY (bucket, device_id, sensor_id)
+            ) WITHOUT ROWID
+        """)
+        if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None:
+            # New table on an existing database: seed it from the raw rows still on disk.
+            # Rows that fell back to the column default hold the literal 'LOCALTIMESTAMP'
+            # (SQLite has no such keyword); only well-formed timestamps make a bucket.
+            conn.execute(f"""
+                INSERT INTO {table} (bucket, device_id, sensor_id, count, sum, min, max)
+                SELECT substr(timestamp, 1, {length}) || '{suffix}', COALESCE(device_id, ''), sensor_id,
+                       COUNT(*), SUM(moisture_level), MIN(moisture_level), MAX(moisture_level)
+                FROM moisture_data
+                WHERE moisture_level IS NOT NULL AND sensor_id IS NOT NULL
+                  AND timestamp GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+                GROUP BY 1, 2, 3
+            """)
+    conn.commit()
+
+def update(conn, records):
+    """
+    Fold timestamped records (database.save_records order) into every tier. Runs in
+    the caller's transaction, so the aggregates commit together with the raw rows.
+    """
+    for tier, (table, _, _, _) in TIERS.items():
+        groups = {}
+        for record in records:
+            timestamp, device_id, sensor_id, moisture = record[0], record[1], record[2], record[4]
+            if moisture is None or sensor_id is None:
+                continue
+            key = (bucket_of(timestamp, tier), device_id or "", sensor_id)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [1, moisture, moisture, moisture]
+            else:
+                group[0] += 1
+                group[1] += moisture
+                group[2] = min(group[2], moisture)
+                group[3] = max(group[3], moisture)
+        conn.executemany(f"""
+            INSERT INTO {table} (bucket, device_id, sensor_id, count, sum, min, max)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (bucket, device_id, sensor_id) DO UPDATE SET
+                count = count + excluded.count,
+                sum = sum + excluded.sum,
+                min = MIN(min, excluded.min),
+                max = MAX(max, excluded.max)
+        """, [key + tuple(group) for key, group in groups.items()])
+
+def prune(conn, now=None):
+    # Drop buckets older than each tier's retention; returns the rows deleted.
+    now = now or datetime.now()
+    deleted = 0
+    with conn:
+        for tier, (table, _, _, days) in TIERS.items():
+            cutoff = bucket_of((now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S"), tier)
+            deleted += conn.execute(f"DELETE FROM {table} WHERE bucket < ?", (cutoff,)).rowcount
+    return deleted
+
+def query(conn, tier="hourly", since=None, until=None, sensor_id=None, limit=ROLLUP_QUERY_LIMIT):
+    """
+    Aggregates of one tier in bucket order as JSON-ready dicts. since/until compare
+    against bucket starts ("YYYY-mm-dd[ HH:MM:SS]"); raises ValueError on a bad tier.
+    """
+    if tier not in TIERS:
+        raise ValueError(f"Unknown rollup tier {tier!r}; expected one of {', '.join(TIERS)}")
+    table = TIERS[tier][0]
+    clauses, params = [], []
+    if since:
+        clauses.append("bucket >= ?")
+        params.append(since)
+    if until:
+        clauses.append("bucket < ?")
+        params.append(until)
+    if sensor_id is not None:
+        clauses.append("sensor_id = ?")
+        params.append(int(sensor_id))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    params.append(int(limit))
+    rows = conn.execute(f"""
+        SELECT bucket, device_id, sensor_id, count, sum, min, max FROM {table}
+        {where} ORDER BY bucket, device_id, sensor_id LIMIT ?
+    """, params).fetchall()
+    return [
+        {"tier": tier, "bucket": bucket, "device_id": device_id, "sensor_id": sensor,
+         "count": count, "mean": round(total / count, 2), "min": low, "max": high}
+        for bucket, device_id, sensor, count, total, low, high in rows
+    ]
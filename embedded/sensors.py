@@ -0,0 +1,352 @@
+import time
+import random
+import logging
+
+from config import (MIN_ADC, MAX_ADC, ADC_DATA_RATE, SENSOR_BOARDS, SENSOR_BACKEND,
+                    SENSOR_CYCLE_BUDGET, OVERSAMPLE_COUNT, OVERSAMPLE_REDUCER, OVERSAMPLE_TRIM,
+                    SENSOR_READ_INTERVAL, SAMPLING_MIN_INTERVAL, SAMPLING_MAX_INTERVAL, SAMPLING_BOUNDS,
+                    SAMPLING_TARGET_DELTA, SAMPLING_NOISE_FLOOR)
+
+# Additional GPIO pins for configuration and alerts.
+ADDR_PIN = 7   # For address configuration
+ALRT_PIN = 0   # For alerts
+
+ADS1115_ADDRESSES = (0x48, 0x49, 0x4A, 0x4B)
+ADS1115_DATA_RATES = (8, 16, 32, 64, 128, 250, 475, 860)
+I2C_OVERHEAD = 0.0005  # Approximate bus time per single-shot read, on top of conversion time
+MAX_RETRIES = 3
+
+def convert_adc_to_moisture(adc_value):
+    # Convert raw ADC value to moisture percentage and round to 2 decimals
+    moisture_level = ((MAX_ADC - adc_value) / (MAX_ADC - MIN_ADC)) * 100
+    return round(max(0, min(100, moisture_level)), 2)
+
+def reduce_samples(samples, reducer=OVERSAMPLE_REDUCER, trim=OVERSAMPLE_TRIM):
+    """
+    Reduce a burst of ADC samples to (value, variance).
+    The value is the median or the trimmed mean. The variance is taken over the
+    samples left after trimming, so a single spike cannot dominate it. Returns a
+    variance of None for a single sample.
+    """
+    ordered = sorted(samples)
+    n = len(ordered)
+    if n == 1:
+        return ordered[0], None
+    cut = min(int(n * trim), (n - 1) // 2)
+    kept = ordered[cut:n - cut]
+    mean = sum(kept) / len(kept)
+    variance = sum((x - mean) ** 2 for x in kept) / len(kept)
+    if reducer == "median":
+        mid = n // 2
+        value = ordered[mid] if n % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+    elif reducer == "trimmed_mean":
+        value = mean
+    else:
+        raise ValueError(f"Unknown oversampling reducer: {reducer}")
+    return int(round(value)), round(variance, 2)
+
+class HardwareBackend:
+    """ADS1115 boards on the Pi's I2C bus plus RPi.GPIO for the digital outputs."""
+
+    def __init__(self, addresses, data_rate=ADC_DATA_RATE):
+        import board
+        import busio
+        import RPi.GPIO as GPIO
+        import adafruit_ads1x15.ads1115 as ADS
+        from adafruit_ads1x15.analog_in import AnalogIn
+        self.GPIO = GPIO
+        self.data_rate = data_rate
+        i2c = busio.I2C(board.SCL, board.SDA)
+        pins = (ADS.P0, ADS.P1, ADS.P2, ADS.P3)
+        # One AnalogIn per (board, channel), created once instead of on every read.
+        self.channels = {}
+        for address in addresses:
+            ads = ADS.ADS1115(i2c, address=address, data_rate=data_rate)
+            for channel, pin in enumerate(pins):
+                self.channels[(address, channel)] = AnalogIn(ads, pin)
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(ADDR_PIN, GPIO.OUT)
+        GPIO.setup(ALRT_PIN, GPIO.IN)
+
+    def setup_digital(self, pin):
+        self.GPIO.setup(pin, self.GPIO.IN)
+
+    def start(self):
+        self.GPIO.output(ADDR_PIN, self.GPIO.HIGH)
+
+    def read_adc(self, address, channel):
+        return self.channels[(address, channel)].value
+
+    def read_digital(self, pin):
+        return self.GPIO.input(pin) == self.GPIO.HIGH
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+class SimulatedBackend:
+    """
+    Stand-in for the ADS1115 boards and GPIO so the sampler runs on a plain Linux box.
+    Each read sleeps for the conversion time of the configured data rate, and returns
+    a per-channel level plus optional gaussian noise and occasional spikes.
+    """
+
+    def __init__(self, addresses, data_rate=ADC_DATA_RATE, levels=None, noise=0.0,
+                 spike_rate=0.0, spike_value=32767, seed=None, sleep=time.sleep):
+        self.addresses = tuple(addresses)
+        self.data_rate = data_rate
+        self.levels = dict(levels or {})
+        self.noise = noise
+        self.spike_rate = spike_rate
+        self.spike_value = spike_value
+        self.random = random.Random(seed)
+        self.sleep = sleep
+        self.reads = 0
+
+    def setup_digital(self, pin):
+        pass
+
+    def start(self):
+        pass
+
+    def set_level(self, address, channel, value):
+        self.levels[(address, channel)] = value
+
+    def read_adc(self, address, channel):
+        if address not in self.addresses:
+            raise OSError(f"No ADS1115 at address {address:#x}")
+        self.sleep(1.0 / self.data_rate + I2C_OVERHEAD)
+        self.reads += 1
+        if self.spike_rate and self.random.random() < self.spike_rate:
+            return self.spike_value
+        level = self.levels.get((address, channel), (MIN_ADC + MAX_ADC) / 2)
+        if self.noise:
+            level += self.random.gauss(0, self.noise)
+        return int(max(1, min(32767, level)))
+
+    def read_digital(self, pin):
+        return False
+
+    def cleanup(self):
+        pass
+
+def create_backend(addresses, kind=SENSOR_BACKEND):
+    if kind == "simulated":
+        return SimulatedBackend(addresses)
+    return HardwareBackend(addresses)
+
+class Sensor:
+    def __init__(self, sensor_id, address, channel, digital=None, active=True):
+        self.sensor_id = sensor_id
+        self.address = address
+        self.channel = channel
+        self.digital = digital
+        self.active = active
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.reads = 0
+
+    @property
+    def label(self):
+        return f"{self.address:#x}/A{self.channel}"
+
+    def record_latency(self, seconds):
+        self.last_latency = seconds
+        self.max_latency = max(self.max_latency, seconds)
+        self.total_latency += seconds
+        self.reads += 1
+
+class SensorRegistry:
+    """Sensors across every configured ADS1115 board, numbered in board/channel order."""
+
+    def __init__(self, boards=SENSOR_BOARDS, backend=None, backend_kind=SENSOR_BACKEND):
+        if ADC_DATA_RATE not in ADS1115_DATA_RATES:
+            raise ValueError(f"ADC_DATA_RATE must be one of {ADS1115_DATA_RATES}, got {ADC_DATA_RATE}")
+        self.sensors = []
+        addresses = []
+        for board_cfg in boards:
+            address = board_cfg["address"]
+            if address not in ADS1115_ADDRESSES:
+                raise ValueError(f"ADS1115 address must be one of 0x48-0x4B, got {address:#x}")
+            if address in addresses:
+                raise ValueError(f"ADS1115 address {address:#x} configured twice")
+            addresses.append(address)
+            for ch in board_cfg["channels"]:
+                self.sensors.append(Sensor(len(self.sensors) + 1, address, ch["channel"],
+                                           ch.get("digital"), ch.get("active", True)))
+        self.addresses = addresses
+        self.backend = backend if backend is not None else create_backend(addresses, backend_kind)
+        for sensor in self.active():
+            if sensor.digital is not None:
+                self.backend.setup_digital(sensor.digital)
+
+    def active(self):
+        return [s for s in self.sensors if s.active]
+
+    def latency_report(self):
+        # Per-channel read latency in milliseconds.
+        return {
+            s.sensor_id: {
+                "channel": s.label,
+                "last_ms": round(s.last_latency * 1000, 3) if s.last_latency is not None else None,
+                "avg_ms": round(s.total_latency / s.reads * 1000, 3) if s.reads else None,
+                "max_ms": round(s.max_latency * 1000, 3),
+                "reads": s.reads,
+            }
+            for s in self.sensors
+        }
+
+def read_sensor_channel(backend, sensor, samples=OVERSAMPLE_COUNT):
+    # Read the ADC value (oversampled when samples > 1) and digital state for a sensor.
+    # Returns (adc_value, moisture_level, digital_status, adc_variance).
+    try:
+        raw = [backend.read_adc(sensor.address, sensor.channel) for _ in range(max(1, samples))]
+        valid = [v for v in raw if v != 0 and v <= 32767]
+        if not valid:
+            logging.warning(f"Sensor channel {sensor.label} might be disconnected.")
+            return raw[0], 0, "Disconnected", None
+        adc_value, adc_variance = reduce_samples(valid)
+        moisture_level = convert_adc_to_moisture(adc_value)
+        if sensor.digital is None:
+            digital_status = "Unknown"
+        else:
+            digital_status = "Dry" if backend.read_digital(sensor.digital) else "Wet"
+        return adc_value, moisture_level, digital_status, adc_variance
+    except OSError as e:
+        logging.error(f"I2C error on sensor {sensor.label}: {e}")
+        return 0, 0, "Error", None
+    except Exception as e:
+        logging.error(f"Unexpected error on sensor {sensor.label}: {e}")
+        return 0, 0, "Error", None
+
+def read_sensor_with_retries(backend, sensor, max_retries=MAX_RETRIES):
+    # Attempt to read sensor data multiple times in case of errors
+    for attempt in range(max_retries):
+        try:
+            return read_sensor_channel(backend, sensor)
+        except Exception as e:
+            logging.warning(f"Retry {attempt+1} for sensor {sensor.label} due to error: {e}")
+            time.sleep(1)
+    logging.error(f"Failed to read sensor {sensor.label} after {max_retries} attempts.")
+    return 0, 0, "Error", None
+
+class SamplingController:
+    """
+    Per-sensor read intervals for ADAPTIVE_SAMPLING. After each reading the sensor's
+    rate of change (beyond SAMPLING_NOISE_FLOOR) sets the interval that would move it
+    about SAMPLING_TARGET_DELTA, within the sensor's (min, max) bounds. Intervals shrink
+    at once, e.g. right after watering, but at most double per reading when moisture
+    goes flat. A digital status flip (the sensor crossing its dry threshold) drops the
+    sensor to its fastest interval. The scheduler ticks at the smallest minimum interval
+    and reads only the sensors that are due.
+    """
+
+    def __init__(self, min_interval=SAMPLING_MIN_INTERVAL, max_interval=SAMPLING_MAX_INTERVAL,
+                 bounds=SAMPLING_BOUNDS, target_delta=SAMPLING_TARGET_DELTA,
+                 noise_floor=SAMPLING_NOISE_FLOOR, initial=SENSOR_READ_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.bounds = bounds
+        self.target_delta = target_delta
+        self.noise_floor = noise_floor
+        self.initial = initial
+        self.state = {}  # sensor_id -> {"interval", "next_due", "moisture", "status", "at", "slope"}
+        self.reads = 0
+
+    @property
+    def tick(self):
+        return min([self.min_interval] + [low for low, _ in self.bounds.values()])
+
+    def limits(self, sensor_id):
+        return self.bounds.get(sensor_id, (self.min_interval, self.max_interval))
+
+    def due(self, sensor, now):
+        state = self.state.get(sensor.sensor_id)
+        # Half a tick of slack so scheduler jitter does not push a read a whole tick late.
+        return state is None or now >= state["next_due"] - self.tick / 2
+
+    def observe(self, sensor, values, now):
+        _, moisture, status, _ = values
+        low, high = self.limits(sensor.sensor_id)
+        state = self.state.get(sensor.sensor_id)
+        if state is None:
+            state = self.state[sensor.sensor_id] = {"interval": min(max(self.initial, low), high), "slope": None,
+                                                    "moisture": None, "status": None, "at": None}
+        self.reads += 1
+        if status in ("Error", "Disconnected"):
+            # No usable reading; retry at the current interval.
+            state["next_due"] = now + state["interval"]
+            return
+        if state["at"] is not None:
+            minutes = max(now - state["at"], 1) / 60
+            rate = max(0.0, abs(moisture - state["moisture"]) - self.noise_floor) / minutes
+            slope = state["slope"]
+            # Rises are taken at once; falls are smoothed so one quiet reading does not back off.
+            state["slope"] = rate if slope is None or rate > slope else (slope + rate) / 2
+            target = self.target_delta / state["slope"] * 60 if state["slope"] else high
+            interval = min(target, state["interval"] * 2)
+            if status != state["status"]:
+                interval = low
+            state["interval"] = min(max(interval, low), high)
+        state.update(moisture=moisture, status=status, at=now, next_due=now + state["interval"])
+
+    def report(self):
+        return {sensor_id: {"interval": round(s["interval"], 1),
+                            "slope_per_min": round(s["slope"], 3) if s["slope"] is not None else None}
+                for sensor_id, s in list(self.state.items())}
+
+class ReadScheduler:
+    """
+    Reads every active sensor once per cycle within a time budget, or with a
+    SamplingController only the sensors that are due.
+    Reads are interleaved across boards (board A ch0, board B ch0, ...). If the budget
+    runs out, the remaining sensors are read first on the next cycle, so a slow bus
+    delays readings instead of starving the same channels every time.
+    """
+
+    def __init__(self, registry, budget=SENSOR_CYCLE_BUDGET, clock=time.monotonic, controller=None):
+        self.registry = registry
+        self.budget = budget
+        self.clock = clock
+        self.controller = controller
+        self.deferred = []
+        self.overruns = 0
+
+    def read_order(self):
+        by_board = {}
+        now = self.clock()
+        for sensor in self.registry.active():
+            if self.controller is not None and not self.controller.due(sensor, now):
+                continue
+            by_board.setdefault(sensor.address, []).append(sensor)
+        order = []
+        columns = max((len(v) for v in by_board.values()), default=0)
+        for i in range(columns):
+            for sensors in by_board.values():
+                if i < len(sensors):
+                    order.append(sensors[i])
+        deferred_ids = {s.sensor_id for s in self.deferred}
+        return self.deferred + [s for s in order if s.sensor_id not in deferred_ids]
+
+    def read_cycle(self, read=read_sensor_with_retries):
+        # Returns [(sensor, (adc_value, moisture_level, digital_status, adc_variance)), ...]
+        started = self.clock()
+        order = self.read_order()
+        results = []
+        for i, sensor in enumerate(order):
+            t0 = self.clock()
+            if results and t0 - started >= self.budget:
+                self.deferred = order[i:]
+                self.overruns += 1
+                logging.warning(f"Sensor read budget of {self.budget}s exhausted; "
+                                f"deferring {len(self.deferred)} channels to next cycle.")
+                break
+            values = read(self.registry.backend, sensor)
+            sensor.record_latency(self.clock() - t0)
+            if self.controller is not None:
+                self.controller.observe(sensor, values, t0)
+            results.append((sensor, values))
+        else:
+            self.deferred = []
+        results.sort(key=lambda r: r[0].sensor_id)
+        return results
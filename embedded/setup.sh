@@ -90,6 +90,8 @@ sudo systemctl enable plant_monitor.service
 sudo systemctl start plant_monitor.service
 
 # Step 9: Optional: Setup systemd service for send_data_api.
+# plant_monitor.py already serves /send-data and /send-current on port 5001; only use this
+# standalone API when plant_monitor runs elsewhere, or the two will fight over the port.
 SEND_API_SERVICE_FILE="/etc/systemd/system/send_data_api.service"
 read -p "Do you want to set up send_data_api.py as a service? (y/n): " SETUP_SEND_API
 if [[ "$SETUP_SEND_API" == "y" || "$SETUP_SEND_API" == "Y" ]]; then
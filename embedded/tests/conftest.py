@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The embedded modules import each other by bare name (run from embedded/), so put
+# that directory on the path for the tests.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
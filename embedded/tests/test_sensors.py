@@ -0,0 +1,59 @@
+import functools
+import statistics
+
+import pytest
+
+from sensors import reduce_samples, read_sensor_channel, SimulatedBackend, Sensor
+
+ADDRESS = 0x48
+LEVEL = 12000
+
+
+def test_median_rejects_a_spike():
+    value, variance = reduce_samples([LEVEL] * 9 + [32767], reducer="median")
+    assert value == LEVEL
+    assert variance == 0
+
+
+def test_trimmed_mean_rejects_spikes_at_both_ends():
+    samples = [LEVEL - 10, LEVEL, LEVEL + 10] * 3 + [1, 32767]
+    value, variance = reduce_samples(samples, reducer="trimmed_mean", trim=0.2)
+    assert value == LEVEL
+    assert variance == pytest.approx(400 / 7, abs=0.01)  # Over the 7 samples left after trimming
+
+
+def test_single_sample_has_no_variance():
+    assert reduce_samples([LEVEL]) == (LEVEL, None)
+
+
+def test_unknown_reducer_raises():
+    with pytest.raises(ValueError):
+        reduce_samples([1, 2, 3], reducer="mode")
+
+
+@pytest.mark.parametrize("reducer, tolerated", [("median", 7), ("trimmed_mean", 3)])
+def test_simulated_adc_with_noise_and_spikes(monkeypatch, reducer, tolerated):
+    # About 10% of reads are full-scale spikes on top of gaussian noise (sigma 50). A
+    # burst of 16 survives up to 7 spikes with the median, and as many as the 20% trim
+    # cuts from each end (3) with the trimmed mean.
+    monkeypatch.setattr("sensors.reduce_samples", functools.partial(reduce_samples, reducer=reducer, trim=0.2))
+    backend = SimulatedBackend([ADDRESS], levels={(ADDRESS, 0): LEVEL}, noise=50,
+                               spike_rate=0.1, seed=4, sleep=lambda seconds: None)
+    raw = []
+    read_adc = backend.read_adc
+    monkeypatch.setattr(backend, "read_adc", lambda *args: raw.append(read_adc(*args)) or raw[-1])
+    sensor = Sensor(1, ADDRESS, 0)
+    readings = [read_sensor_channel(backend, sensor, samples=16) for _ in range(200)]
+    bursts = [raw[i:i + 16] for i in range(0, len(raw), 16)]
+
+    spiked = [burst.count(backend.spike_value) for burst in bursts]
+    assert sum(1 for n in spiked if 0 < n <= tolerated) > 100
+    assert abs(statistics.mean(raw) - LEVEL) > 1000  # A plain mean would be dragged off
+    for (adc_value, moisture_level, digital_status, adc_variance), spikes in zip(readings, spiked):
+        if spikes > tolerated:
+            continue
+        assert abs(adc_value - LEVEL) < 150
+        assert adc_variance is not None
+        if spikes <= 3:
+            # Taken after the 20% trim, so it reflects the noise rather than the spikes.
+            assert adc_variance < 10000
@@ -0,0 +1,103 @@
+import os
+import tracemalloc
+
+import database
+import uplink
+
+ROW = ("2026-10-17 12:00:00", "dev-1", 1, 12000.0, 53.3, "Wet", 21.5, 60.0, 300.0, 3.2, "Stockton",
+       "2026-10-17 11:00:00", None)
+# The large backlog; set UPLINK_TEST_BACKLOG=1000000 for the full run (about 90 s,
+# most of it tracemalloc overhead).
+LARGE_BACKLOG = int(os.getenv("UPLINK_TEST_BACKLOG", "100000"))
+
+
+def make_backlog(path, rows):
+    conn = database.connect(str(path))
+    database.setup_database(conn)
+    # Straight into moisture_data: the rollups that save_records maintains do not
+    # matter here and would only slow the setup.
+    with conn:
+        for start in range(0, rows, 50000):
+            conn.executemany("""
+                INSERT INTO moisture_data
+                (timestamp, device_id, sensor_id, adc_value, moisture_level, digital_status,
+                 weather_temp, weather_humidity, weather_sunlight, weather_wind_speed,
+                 location, weather_fetched, adc_variance)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [ROW] * min(50000, rows - start))
+    return conn
+
+
+def peak_streaming(conn):
+    """Stream every unsent row in uplink batches; returns (rows, peak traced bytes)."""
+    batcher = uplink.AdaptiveBatcher(initial=500, minimum=500, maximum=500)
+    rows = 0
+    tracemalloc.start()
+    try:
+        for batch in uplink.unsent_batches(conn, batcher):
+            rows += len(batch)
+        return rows, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_peak_memory_does_not_grow_with_backlog(tmp_path):
+    # Keyset pages of UPLINK_PAGE_ROWS and batches of 500 rows keep the peak at about
+    # 1 MB for 10k, 100k and 1M row backlogs alike, where reading the backlog at once
+    # would take hundreds of MB.
+    peaks = {}
+    for rows in (10000, LARGE_BACKLOG):
+        conn = make_backlog(tmp_path / f"backlog_{rows}.db", rows)
+        streamed, peaks[rows] = peak_streaming(conn)
+        conn.close()
+        assert streamed == rows
+    assert peaks[LARGE_BACKLOG] < peaks[10000] * 1.5
+    assert peaks[LARGE_BACKLOG] < 4 * 1024 * 1024
+
+
+class FakeBackend:
+    """Stands in for UplinkClient.post: answers each request by its format."""
+
+    def __init__(self, columnar_status, json_status):
+        self.status = {True: columnar_status, False: json_status}
+        self.formats = []
+
+    def __call__(self, url, data, columnar):
+        self.formats.append(columnar)
+        return type("Response", (), {"status_code": self.status[columnar], "text": ""})()
+
+
+def client_with(backend, monkeypatch):
+    client = uplink.UplinkClient(columnar_retry=60)
+    client.columnar = True
+    monkeypatch.setattr(client, "post", backend)
+    return client
+
+
+def test_validation_error_keeps_columnar(monkeypatch):
+    # A bad row gets 422 in either format; that says nothing about columnar support.
+    backend = FakeBackend(columnar_status=422, json_status=422)
+    client = client_with(backend, monkeypatch)
+    for _ in range(2):
+        assert not client.post_batch("http://backend", [{"id": 1}]).ok
+    assert backend.formats == [True, False, True, False]
+
+
+def test_old_backend_falls_back_to_json_for_a_while(monkeypatch):
+    backend = FakeBackend(columnar_status=422, json_status=200)
+    client = client_with(backend, monkeypatch)
+    assert client.post_batch("http://backend", [{"id": 1}]).ok
+    assert client.post_batch("http://backend", [{"id": 2}]).ok
+    assert backend.formats == [True, False, False]
+    # Once columnar_retry has passed, columnar is tried again.
+    client.columnar_at = 0.0
+    assert client.post_batch("http://backend", [{"id": 3}]).ok
+    assert backend.formats == [True, False, False, True, False]
+
+
+def test_unsupported_media_type_falls_back_to_json(monkeypatch):
+    backend = FakeBackend(columnar_status=415, json_status=503)
+    client = client_with(backend, monkeypatch)
+    assert not client.post_batch("http://backend", [{"id": 1}]).ok
+    client.post_batch("http://backend", [{"id": 1}])
+    assert backend.formats == [True, False, False]
@@ -0,0 +1,34 @@
+from utils import CsvSink, CSV_HEADER
+
+
+def read_lines(path):
+    return path.read_text().splitlines()
+
+
+def test_outdated_header_is_rotated(tmp_path):
+    # A file written before adc_variance existed keeps its rows and 12-column header.
+    path = tmp_path / "moisture.csv"
+    old = [",".join(CSV_HEADER[:-1]), ",".join(["1"] * 12)]
+    path.write_text("\n".join(old) + "\n")
+
+    sink = CsvSink(filename=str(path), enabled=True, gzip_rotated=False, max_total_bytes=0)
+    sink.write(["2"] * 13)
+    sink.flush()
+    sink.close()
+
+    assert read_lines(path) == [",".join(CSV_HEADER), ",".join(["2"] * 13)]
+    rotated = [p for p in tmp_path.iterdir() if p != path]
+    assert len(rotated) == 1
+    assert read_lines(rotated[0]) == old
+
+
+def test_current_header_is_appended_to(tmp_path):
+    path = tmp_path / "moisture.csv"
+    for value in ("1", "2"):
+        sink = CsvSink(filename=str(path), enabled=True, gzip_rotated=False, max_total_bytes=0)
+        sink.write([value] * 13)
+        sink.flush()
+        sink.close()
+
+    assert read_lines(path) == [",".join(CSV_HEADER), ",".join(["1"] * 13), ",".join(["2"] * 13)]
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,527 @@
+import os
+import gzip
+import json
+import time
+import sqlite3
+import uuid
+import logging
+import threading
+import contextlib
+import collections
+import requests
+from datetime import datetime
+
+import wire_format as wire_format_module
+from config import (DB_SYNCHRONOUS, UPLINK_TIMEOUT, UPLINK_GZIP, UPLINK_GZIP_MIN_BYTES, UPLINK_PAGE_ROWS, UPLINK_BATCH_INITIAL,
+                    UPLINK_BATCH_MIN, UPLINK_BATCH_MAX, UPLINK_MAX_PAYLOAD_BYTES, UPLINK_FAST_RESPONSE,
+                    UPLINK_WINDOW, UPLINK_FORMAT, UPLINK_COLUMNAR_RETRY, UPLINK_DEADBAND, UPLINK_DEADBAND_DEFAULT,
+                    UPLINK_DEADBAND_BY_SENSOR, UPLINK_HEARTBEAT, SEND_JOB_HISTORY)
+
+# The sent watermark lives in the uplink_outbox table next to the readings: the id of
+# the last row the backend acknowledged as part of a fully acked prefix. Batches
+# acknowledged ahead of it (while an earlier batch was outstanding or failed) are kept
+# as [first_id, last_id] rows in uplink_acked, skipped when resending, and dropped once
+# the watermark passes them. Both are only written in short transactions committed
+# with synchronous=FULL, so a power cut cannot lose an advance or apply a partial one.
+
+# Files used by earlier versions; imported once by import_legacy_state().
+LAST_SENT_FILE = "last_sent_id.txt"
+ACKED_RANGES_FILE = "acked_ranges.json"
+
+@contextlib.contextmanager
+def durable_transaction(conn):
+    # The sampler's commits run with DB_SYNCHRONOUS (NORMAL); watermark commits are
+    # rare and must survive power loss, so they are fsynced.
+    conn.execute("PRAGMA synchronous = FULL")
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+
+def get_last_sent_id(conn):
+    row = conn.execute("SELECT last_sent_id FROM uplink_outbox WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+def get_acked_ranges(conn):
+    return conn.execute("SELECT first_id, last_id FROM uplink_acked ORDER BY first_id").fetchall()
+
+def import_legacy_state(conn):
+    """Move last_sent_id.txt / acked_ranges.json into the outbox tables, once."""
+    if not os.path.exists(LAST_SENT_FILE):
+        return
+    try:
+        with open(LAST_SENT_FILE, "r") as f:
+            last_id = int(f.read().strip() or 0)
+        ranges = []
+        if os.path.exists(ACKED_RANGES_FILE):
+            with open(ACKED_RANGES_FILE, "r") as f:
+                ranges = [tuple(r) for r in json.load(f)]
+        with durable_transaction(conn):
+            if conn.execute("SELECT 1 FROM uplink_outbox WHERE id = 1").fetchone() is None:
+                conn.execute("INSERT INTO uplink_outbox (id, last_sent_id) VALUES (1, ?)", (last_id,))
+                conn.executemany("INSERT OR REPLACE INTO uplink_acked (first_id, last_id) VALUES (?, ?)",
+                                 [r for r in ranges if r[1] > last_id])
+        for path in (LAST_SENT_FILE, ACKED_RANGES_FILE):
+            if os.path.exists(path):
+                os.replace(path, path + ".migrated")
+        logging.info(f"Imported legacy uplink watermark {last_id} into the database.")
+    except Exception as e:
+        logging.error(f"Error importing legacy uplink state: {e}")
+
+def fetch_unsent_rows(conn, last_id, page_size=UPLINK_PAGE_ROWS):
+    """
+    Yield rows (tuples) with id greater than last_id in id order, one keyset page
+    (WHERE id > ? ORDER BY id LIMIT ?) at a time, so at most page_size rows are in
+    memory however large the backlog is.
+    """
+    cursor = conn.cursor()
+    while True:
+        try:
+            cursor.execute(
+                """
+                SELECT id, timestamp, sensor_id, adc_value, moisture_level, digital_status,
+                       weather_temp, weather_humidity, weather_sunlight, weather_wind_speed,
+                       location, weather_fetched, device_id
+                FROM moisture_data
+                WHERE id > ?
+                ORDER BY id ASC
+                LIMIT ?
+                """,
+                (last_id, page_size),
+            )
+            page = cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Database error in fetch_unsent_rows: {e}")
+            return
+        yield from page
+        if len(page) < page_size:
+            return
+        last_id = page[-1][0]
+
+def row_to_dict(row):
+    """
+    Convert a database row to a dictionary matching the required JSON structure.
+    """
+    return {
+        "id": row[0],
+        "timestamp": row[1],
+        "sensor_id": row[2],
+        "adc_value": row[3],
+        "moisture_level": round(row[4], 2) if row[4] is not None else 0,
+        "digital_status": row[5] or "",
+        "weather_temp": row[6] or 0,
+        "weather_humidity": row[7] or 0,
+        "weather_sunlight": row[8] or 0,
+        "weather_wind_speed": row[9] or 0,
+        "location": row[10] or "",
+        "weather_fetched": row[11] or "",
+        "device_id": row[12] or "",
+    }
+
+def row_size(row):
+    # Bytes this row adds to the uncompressed JSON body (plus its separating comma).
+    return len(json.dumps(row, separators=(",", ":"))) + 1
+
+class DeadbandFilter:
+    """
+    Optional uplink volume reduction (UPLINK_DEADBAND). A reading is uploaded when its
+    moisture moved more than the sensor's threshold (UPLINK_DEADBAND_BY_SENSOR, else
+    UPLINK_DEADBAND_DEFAULT) from the last uploaded reading of that sensor, when its
+    digital status changed, or when UPLINK_HEARTBEAT seconds passed since the last
+    upload. Every reading still stays in SQLite. Uploaded rows are the change points of a
+    step series: a value holds until the sensor's next row, and a gap longer than the
+    heartbeat means data is missing.
+
+    The state (last uploaded moisture, status and time per sensor) is replaced, never
+    mutated, so each batch can keep the state as of its last row. It is persisted
+    with the watermark, so a resend after a failure or a restart selects the same rows.
+    """
+
+    def __init__(self, state=None, default=UPLINK_DEADBAND_DEFAULT, thresholds=UPLINK_DEADBAND_BY_SENSOR,
+                 heartbeat=UPLINK_HEARTBEAT):
+        self.state = dict(state or {})
+        self.default = default
+        self.thresholds = thresholds
+        self.heartbeat = heartbeat
+        self.seen = 0
+        self.selected = 0
+
+    def select(self, row):
+        # row is a fetch_unsent_rows() tuple.
+        self.seen += 1
+        key = f"{row[12]}:{row[2]}"
+        moisture = row[4] if row[4] is not None else 0
+        try:
+            ts = datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S").timestamp()
+        except (TypeError, ValueError):
+            ts = None
+        last = self.state.get(key)
+        if last is not None and ts is not None and last[2] is not None:
+            last_moisture, last_status, last_ts = last
+            threshold = self.thresholds.get(row[2], self.default)
+            if (abs(moisture - last_moisture) <= threshold and row[5] == last_status
+                    and ts - last_ts < self.heartbeat):
+                return False
+        self.state = dict(self.state)
+        self.state[key] = (moisture, row[5], ts)
+        self.selected += 1
+        return True
+
+class UplinkBatch(list):
+    """
+    A batch of JSON-ready row dicts. first_id is the first row id it accounts for,
+    including rows before it that the deadband skipped; filter_state is the deadband
+    state after its last row.
+    """
+    first_id = None
+    filter_state = None
+
+def unsent_batches(conn, batcher, deadband=None):
+    """
+    Stream the unsent rows as lists of JSON-ready dicts. Each batch holds at most
+    batcher.size rows and batcher.max_bytes of JSON (always at least one row); both
+    are read again for every batch, so the sizing adapts while streaming. With a
+    DeadbandFilter only the selected rows are batched.
+    """
+    acked = get_acked_ranges(conn)
+    next_id = get_last_sent_id(conn) + 1
+    rows = fetch_unsent_rows(conn, next_id - 1)
+    if deadband is not None:
+        # The filter sees rows in acked ranges too, so its state matches the first pass.
+        rows = (r for r in rows if deadband.select(r))
+    if acked:
+        rows = (r for r in rows if not any(first <= r[0] <= last for first, last in acked))
+    dicts = ((row_to_dict(r), deadband.state if deadband else None) for r in rows)
+    carry = None
+    while True:
+        batch = UplinkBatch() if carry is None else UplinkBatch([carry[0]])
+        nbytes = 0 if carry is None else row_size(carry[0])
+        state = None if carry is None else carry[1]
+        carry = None
+        for row, row_state in dicts:
+            size = row_size(row)
+            if batch and nbytes + size > batcher.max_bytes:
+                carry = (row, row_state)
+                break
+            batch.append(row)
+            nbytes += size
+            state = row_state
+            if len(batch) >= batcher.size:
+                break
+        if not batch:
+            return
+        batch.first_id = next_id
+        batch.filter_state = state
+        next_id = batch[-1]["id"] + 1
+        yield batch
+
+def load_deadband(conn):
+    """A DeadbandFilter resumed from the persisted state, or None when disabled."""
+    if not UPLINK_DEADBAND:
+        return None
+    row = conn.execute("SELECT filter_state FROM uplink_outbox WHERE id = 1").fetchone()
+    state = {}
+    if row and row[0]:
+        try:
+            state = {k: tuple(v) for k, v in json.loads(row[0]).items()}
+        except ValueError as e:
+            logging.error(f"Discarding unreadable deadband state: {e}")
+    return DeadbandFilter(state)
+
+UploadResult = collections.namedtuple("UploadResult", "ok status seconds")
+
+class AdaptiveBatcher:
+    """
+    Chooses the uplink batch size, like TCP congestion control. It grows after a
+    successful response faster than UPLINK_FAST_RESPONSE, doubling below the threshold
+    and adding UPLINK_BATCH_MIN above it. After a timeout, connection error, 5xx or 413
+    it halves, and the threshold drops to the new size. Slow successes and other
+    failures leave it unchanged. The size stays within
+    [UPLINK_BATCH_MIN, UPLINK_BATCH_MAX]. Recent (size, rows/s) samples are kept for
+    diagnostics.
+    """
+
+    def __init__(self, initial=UPLINK_BATCH_INITIAL, minimum=UPLINK_BATCH_MIN, maximum=UPLINK_BATCH_MAX,
+                 max_bytes=UPLINK_MAX_PAYLOAD_BYTES, fast_response=UPLINK_FAST_RESPONSE):
+        self.size = max(minimum, min(maximum, initial))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_bytes = max_bytes
+        self.fast_response = fast_response
+        self.threshold = maximum
+        self.history = collections.deque(maxlen=20)
+        self.rows_sent = 0
+        self.failures = 0
+
+    def record(self, rows, result):
+        used = self.size
+        if result.ok:
+            self.rows_sent += rows
+            if result.seconds < self.fast_response:
+                grown = self.size * 2 if self.size < self.threshold else self.size + self.minimum
+                self.size = min(self.maximum, grown)
+        else:
+            self.failures += 1
+            if result.status is None or result.status >= 500 or result.status == 413:
+                self.size = max(self.minimum, self.size // 2)
+                self.threshold = self.size
+        rate = rows / result.seconds if result.ok and result.seconds > 0 else 0.0
+        self.history.append({"batch_size": used, "rows": rows, "ok": result.ok, "status": result.status,
+                             "seconds": round(result.seconds, 3), "rows_per_s": round(rate, 1)})
+        if self.size != used:
+            logging.info(f"Uplink batch size {used} -> {self.size} (status={result.status}, "
+                         f"{result.seconds:.2f}s for {rows} rows)")
+
+    def stats(self):
+        return {"batch_size": self.size, "threshold": self.threshold, "max_bytes": self.max_bytes, "rows_sent": self.rows_sent,
+                "failures": self.failures, "recent": list(self.history)}
+
+class UplinkClient:
+    """
+    Posts batches to the backend over one keep-alive HTTP(S) session, so the TLS
+    handshake is paid once rather than per batch. Bodies are serialized in memory, as
+    columnar msgpack (wire_format.py) or JSON, and gzipped above UPLINK_GZIP_MIN_BYTES. Touches no database state, so post_batch can
+    run on worker threads, up to UPLINK_WINDOW at once.
+    """
+
+    def __init__(self, use_gzip=UPLINK_GZIP, timeout=UPLINK_TIMEOUT, gzip_min_bytes=UPLINK_GZIP_MIN_BYTES,
+                 pool_size=UPLINK_WINDOW, wire_format=UPLINK_FORMAT, columnar_retry=UPLINK_COLUMNAR_RETRY):
+        self.use_gzip = use_gzip
+        self.timeout = timeout
+        self.gzip_min_bytes = gzip_min_bytes
+        # "columnar" needs msgpack on the device and a backend that accepts it. Without
+        # msgpack the client stays on JSON; a backend that turns columnar away puts it on
+        # JSON until columnar_at, columnar_retry seconds later.
+        self.columnar = wire_format == "columnar" and wire_format_module.available()
+        self.columnar_retry = columnar_retry
+        self.columnar_at = 0.0
+        self.session = requests.Session()
+        # One pooled connection per in-flight batch.
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def encode(self, data, columnar=False):
+        body = wire_format_module.encode_columnar(data) if columnar else None
+        if body is not None:
+            headers = {"Content-Type": wire_format_module.COLUMNAR_CONTENT_TYPE}
+        else:
+            body = json.dumps({"data": data}, separators=(",", ":")).encode()
+            headers = {"Content-Type": "application/json"}
+        if self.use_gzip and len(body) >= self.gzip_min_bytes:
+            # Level 6 is the usual size/CPU trade-off; the Pi's CPU is not the bottleneck here.
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    def post(self, url, data, columnar):
+        body, headers = self.encode(data, columnar)
+        response = self.session.post(url, data=body, headers=headers, timeout=self.timeout)
+        # Read the body so the connection goes back to the pool for the next batch.
+        response.content
+        return response
+
+    def post_batch(self, url, data):
+        """Returns an UploadResult; ok only when the backend answers HTTP 200 (or 202, durably queued)."""
+        t0 = time.monotonic()
+        try:
+            columnar = self.columnar and t0 >= self.columnar_at
+            response = self.post(url, data, columnar)
+            if columnar and response.status_code in (415, 422):
+                # An older backend answers 415, or 422 from parsing the body as JSON, but 422
+                # is also a plain validation error. Resend this batch as JSON; stay on JSON
+                # for a while only on a 415 or when the backend accepts the JSON.
+                rejected = response.status_code
+                response = self.post(url, data, False)
+                if rejected == 415 or response.status_code in (200, 202):
+                    logging.warning(f"Backend rejected a columnar batch (HTTP {rejected}); "
+                                    f"using JSON for {self.columnar_retry}s.")
+                    self.columnar_at = time.monotonic() + self.columnar_retry
+        except Exception as e:
+            logging.error(f"Upload failed for batch at row {data[0]['id']}: {e}")
+            return UploadResult(False, None, time.monotonic() - t0)
+        seconds = time.monotonic() - t0
+        if response.status_code in (200, 202):
+            logging.info(f"Batch of {len(data)} rows starting at row {data[0]['id']} sent successfully "
+                         f"(HTTP {response.status_code}).")
+            return UploadResult(True, response.status_code, seconds)
+        logging.error(f"Upload failed for batch at row {data[0]['id']}: "
+                      f"http_code={response.status_code}, body={response.text[:200]}")
+        return UploadResult(False, response.status_code, seconds)
+
+    def close(self):
+        self.session.close()
+
+class AckWindow:
+    """
+    Batches in flight, in send order. Acknowledgements may arrive in any order;
+    ack() returns the new watermark (last id of the longest fully acknowledged
+    prefix) or None when an earlier batch is still outstanding. filter_state is the
+    deadband state that goes with the current watermark.
+    """
+
+    def __init__(self):
+        self.batches = collections.OrderedDict()  # last_id -> [acked, filter_state]
+        self.filter_state = None
+
+    def __len__(self):
+        return len(self.batches)
+
+    def add(self, last_id, filter_state=None):
+        self.batches[last_id] = [False, filter_state]
+
+    def ack(self, last_id):
+        self.batches[last_id][0] = True
+        watermark = None
+        while self.batches and next(iter(self.batches.values()))[0]:
+            watermark, (_, self.filter_state) = self.batches.popitem(last=False)
+        return watermark
+
+def mark_sent(conn, last_id, filter_state=None):
+    """
+    Advance the watermark after a batch was acknowledged; it never moves backwards.
+    A deadband filter_state is stored with it when the watermark actually moves.
+    """
+    encoded = json.dumps(filter_state) if filter_state is not None else None
+    with durable_transaction(conn):
+        conn.execute("INSERT INTO uplink_outbox (id, last_sent_id, filter_state) VALUES (1, ?, ?) "
+                     "ON CONFLICT (id) DO UPDATE SET "
+                     "filter_state = CASE WHEN excluded.last_sent_id > last_sent_id AND excluded.filter_state IS NOT NULL "
+                     "THEN excluded.filter_state ELSE filter_state END, "
+                     "last_sent_id = MAX(last_sent_id, excluded.last_sent_id)",
+                     (last_id, encoded))
+        conn.execute("DELETE FROM uplink_acked WHERE last_id <= ?", (last_id,))
+
+def mark_acked(conn, first_id, last_id, window):
+    """
+    Record an acknowledged batch: advance the watermark if it completes the acked
+    prefix, otherwise remember the range (and its deadband state) so it is not sent again.
+    """
+    filter_state = window.batches[last_id][1]
+    watermark = window.ack(last_id)
+    if watermark is not None:
+        mark_sent(conn, watermark, window.filter_state)
+    else:
+        encoded = json.dumps(filter_state) if filter_state is not None else None
+        with durable_transaction(conn):
+            conn.execute("INSERT OR REPLACE INTO uplink_acked (first_id, last_id, filter_state) VALUES (?, ?, ?)",
+                         (first_id, last_id, encoded))
+
+def advance_over_acked(conn):
+    """
+    Move the watermark across acked ranges that start at the next stored row, e.g. a
+    tail batch acked before the batch ahead of it, which was resent later. Call only
+    with nothing in flight.
+    """
+    try:
+        while True:
+            row = conn.execute("SELECT MIN(id) FROM moisture_data WHERE id > ?",
+                               (get_last_sent_id(conn),)).fetchone()
+            if not row or row[0] is None:
+                return
+            row = conn.execute("SELECT last_id, filter_state FROM uplink_acked WHERE first_id <= ? AND last_id >= ? "
+                               "ORDER BY last_id DESC LIMIT 1", (row[0], row[0])).fetchone()
+            if not row:
+                return
+            mark_sent(conn, row[0], json.loads(row[1]) if row[1] else None)
+    except sqlite3.Error as e:
+        logging.error(f"Database error in advance_over_acked: {e}")
+
+def send_unsent_rows(conn, url, client, batcher):
+    """
+    Stream the unsent rows in batches sized by batcher and post each one through client.
+    Only mark as sent when HTTP 200 (or 202) is returned.
+    """
+    sent_any = False
+    window = AckWindow()
+    for data in unsent_batches(conn, batcher, load_deadband(conn)):
+        window.add(data[-1]["id"], data.filter_state)
+        result = client.post_batch(url, data)
+        batcher.record(len(data), result)
+        if not result.ok:
+            return False
+        mark_acked(conn, data.first_id, data[-1]["id"], window)
+        sent_any = True
+    advance_over_acked(conn)
+    if not sent_any:
+        logging.info("No unsent rows to send.")
+    return True
+
+def get_min_id_after_timestamp(conn, ts_str):
+    """
+    Return the minimum row id where the database's timestamp is greater than the provided ts_str.
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT MIN(id) FROM moisture_data WHERE timestamp > ?",
+            (ts_str,),
+        )
+        row = cursor.fetchone()
+        return row[0] if row and row[0] else None
+    except Exception as e:
+        logging.error(f"Error in get_min_id_after_timestamp: {e}")
+        return None
+
+def reset_after(conn, after_str, source):
+    """Rewind the watermark so rows newer than after_str are sent again."""
+    new_min = get_min_id_after_timestamp(conn, after_str)
+    if new_min is not None:
+        with durable_transaction(conn):
+            conn.execute("INSERT INTO uplink_outbox (id, last_sent_id) VALUES (1, ?) "
+                         "ON CONFLICT (id) DO UPDATE SET last_sent_id = excluded.last_sent_id", (new_min - 1,))
+            conn.execute("DELETE FROM uplink_acked")
+            conn.execute("UPDATE uplink_outbox SET filter_state = NULL")
+        logging.info(f"{source} reset the uplink watermark to {new_min - 1} using after={after_str}")
+
+class SendJobs:
+    """
+    Send jobs behind the /send-data and /send-current endpoints. A request gets a job
+    id back at once and polls /send-status for the outcome. A plain trigger joins the
+    newest queued or running job for the same endpoint, so concurrent requests
+    collapse into one upload and share its result; a trigger with an 'after' reset
+    always gets its own job. Thread-safe.
+    """
+
+    def __init__(self, history=SEND_JOB_HISTORY):
+        self.lock = threading.Lock()
+        self.jobs = collections.OrderedDict()  # job id -> job dict, oldest first
+        self.history = history
+
+    def submit(self, url, after_str=None, source="Scheduler"):
+        # Returns (job, created); only a created job needs to be run by the caller.
+        with self.lock:
+            if after_str is None:
+                for job in reversed(self.jobs.values()):
+                    if job["url"] == url and job["after"] is None and job["status"] in ("queued", "running"):
+                        job["waiters"] += 1
+                        logging.info(f"{source} joined send job {job['id']}.")
+                        return job, False
+            job = {"id": uuid.uuid4().hex[:12], "url": url, "source": source, "after": after_str,
+                   "status": "queued", "ok": None, "error": None, "waiters": 1,
+                   "created": time.time(), "started": None, "finished": None}
+            self.jobs[job["id"]] = job
+            finished = [j for j in self.jobs.values() if j["finished"] is not None]
+            for old in finished[:max(0, len(finished) - self.history)]:
+                del self.jobs[old["id"]]
+            return job, True
+
+    def start(self, job):
+        with self.lock:
+            job["status"] = "running"
+            job["started"] = time.time()
+
+    def finish(self, job, ok, error=None):
+        with self.lock:
+            job["status"] = "succeeded" if ok else "failed"
+            job["ok"] = ok
+            job["error"] = error
+            job["finished"] = time.time()
+
+    def status(self, job_id=None):
+        # A copy of one job (KeyError if unknown), or every known job without an id.
+        with self.lock:
+            if job_id is None:
+                return {"jobs": [dict(job) for job in self.jobs.values()]}
+            return dict(self.jobs[job_id])
@@ -1,20 +1,130 @@
 import os
 import csv
+import glob
+import gzip
+import shutil
 import logging
-from config import ENABLE_CSV_OUTPUT, CSV_FILENAME
-
-def save_to_csv(record):
-    if not ENABLE_CSV_OUTPUT:
-        return
-    file_exists = os.path.isfile(CSV_FILENAME)
-    try:
-        with open(CSV_FILENAME, mode="a", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            if not file_exists:
-                header = ["timestamp", "device_id", "sensor_id", "adc_value", "moisture_level", "digital_status",
-                          "weather_temp", "weather_humidity", "weather_sunlight",
-                          "weather_wind_speed", "location", "weather_fetched"]
-                writer.writerow(header)
-            writer.writerow(record)
-    except Exception as e:
-        logging.error(f"Error writing to CSV file: {e}")
\ No newline at end of file
+from datetime import datetime
+from config import (ENABLE_CSV_OUTPUT, CSV_FILENAME, CSV_ROTATE_DAILY, CSV_ROTATE_MAX_BYTES,
+                    CSV_GZIP_ROTATED, CSV_MAX_TOTAL_BYTES)
+
+CSV_HEADER = ["timestamp", "device_id", "sensor_id", "adc_value", "moisture_level", "digital_status",
+              "weather_temp", "weather_humidity", "weather_sunlight",
+              "weather_wind_speed", "location", "weather_fetched", "adc_variance"]
+
+class CsvSink:
+    """
+    Appends readings to CSV_FILENAME through one open file handle.
+    Rows are buffered and written once per cycle by flush(). The file rotates when
+    the day changes or it grows past CSV_ROTATE_MAX_BYTES. Rotated files are
+    optionally gzipped, and the oldest are deleted to keep all CSV output under
+    CSV_MAX_TOTAL_BYTES. An existing file with a different header is rotated on open.
+    """
+
+    def __init__(self, filename=CSV_FILENAME, enabled=ENABLE_CSV_OUTPUT, rotate_daily=CSV_ROTATE_DAILY,
+                 max_bytes=CSV_ROTATE_MAX_BYTES, gzip_rotated=CSV_GZIP_ROTATED,
+                 max_total_bytes=CSV_MAX_TOTAL_BYTES):
+        self.filename = filename
+        self.enabled = enabled
+        self.rotate_daily = rotate_daily
+        self.max_bytes = max_bytes
+        self.gzip_rotated = gzip_rotated
+        self.max_total_bytes = max_total_bytes
+        self.pending = []
+        self.file = None
+        self.writer = None
+        self.opened_day = None
+
+    def write(self, record):
+        if self.enabled:
+            self.pending.append(record)
+
+    def header_matches(self):
+        with open(self.filename, newline="") as f:
+            return next(csv.reader(f), None) == CSV_HEADER
+
+    def open(self):
+        exists = os.path.isfile(self.filename) and os.path.getsize(self.filename) > 0
+        if exists and not self.header_matches():
+            # Written with an older column set: set it aside instead of appending rows
+            # that no longer line up with its header.
+            logging.info(f"CSV file {self.filename} has an outdated header; rotating it.")
+            self.archive()
+            exists = False
+        if exists:
+            self.opened_day = datetime.fromtimestamp(os.path.getmtime(self.filename)).date()
+        else:
+            self.opened_day = datetime.now().date()
+        self.file = open(self.filename, mode="a", newline="")
+        self.writer = csv.writer(self.file)
+        if not exists:
+            self.writer.writerow(CSV_HEADER)
+
+    def needs_rotation(self):
+        if self.rotate_daily and self.opened_day != datetime.now().date():
+            return True
+        return bool(self.max_bytes) and self.file.tell() >= self.max_bytes
+
+    def flush(self):
+        # Write the buffered rows in one go; called once per sampling cycle.
+        if not self.pending:
+            return
+        try:
+            if self.file is None:
+                self.open()
+            elif self.needs_rotation():
+                self.rotate()
+            self.writer.writerows(self.pending)
+            self.file.flush()
+            self.pending = []
+        except Exception as e:
+            logging.error(f"Error writing to CSV file: {e}")
+            # Drop the handle so the next flush reopens the file.
+            self.close()
+
+    def rotated_files(self):
+        base, ext = os.path.splitext(self.filename)
+        return sorted(glob.glob(f"{glob.escape(base)}.*{ext}*"), key=os.path.getmtime)
+
+    def rotate(self):
+        self.close()
+        self.archive()
+        self.open()
+
+    def archive(self):
+        # Move the active file to a timestamped name, gzipped when configured.
+        base, ext = os.path.splitext(self.filename)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        target = f"{base}.{stamp}{ext}"
+        n = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{base}.{stamp}-{n}{ext}"
+            n += 1
+        os.replace(self.filename, target)
+        if self.gzip_rotated:
+            with open(target, "rb") as src, gzip.open(target + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(target)
+        self.enforce_total_size()
+
+    def enforce_total_size(self):
+        # Delete the oldest rotated files until they fit the cap, keeping room for the
+        # active file to grow to CSV_ROTATE_MAX_BYTES.
+        if not self.max_total_bytes:
+            return
+        rotated = self.rotated_files()
+        total = sum(os.path.getsize(p) for p in rotated) + (self.max_bytes or 0)
+        while rotated and total > self.max_total_bytes:
+            oldest = rotated.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            logging.info(f"Removed rotated CSV file {oldest} to stay under {self.max_total_bytes} bytes.")
+
+    def close(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except Exception as e:
+                logging.error(f"Error closing CSV file: {e}")
+        self.file = None
+        self.writer = None
@@ -1,14 +1,29 @@
 import os
+import json
+import math
+import time
+import bisect
+import threading
 import requests
 import logging
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from config import (WEATHER_FETCH_INTERVAL, WEATHER_RETRY_INTERVAL, WEATHER_CACHE_TTL,
+                    WEATHER_CACHE_FILE, WEATHER_PAST_HOURS, WEATHER_FORECAST_HOURS, LOCATION_CACHE_FILE, LOCATION_CACHE_TTL,
+                    LOCATION_RETRY_INTERVAL, LOCATION_LOOKUP_TIMEOUT)
 
 FALLBACK_LAT = os.getenv("FALLBACK_LAT", "")
 FALLBACK_LON = os.getenv("FALLBACK_LON", "")
 
-def get_ipinfo_location():
+# Geolocation provider endpoints; overridable so they can point at local stub servers.
+IPINFO_URL = os.getenv("IPINFO_URL", "https://ipinfo.io/json")
+GEOPLUGIN_URL = os.getenv("GEOPLUGIN_URL", "http://www.geoplugin.net/json.gp")
+
+def get_ipinfo_location(url=None):
     # Query ipinfo.io and return (lat, lon, location_name)
     try:
-        response = requests.get("https://ipinfo.io/json", timeout=10)
+        response = requests.get(url or IPINFO_URL, timeout=LOCATION_LOOKUP_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         loc_str = data.get("loc", None)
@@ -27,10 +42,10 @@ def get_ipinfo_location():
         logging.error(f"Failed to get location from ipinfo.io: {e}")
     return None, None, None
 
-def get_geoplugin_location():
+def get_geoplugin_location(url=None):
     # Query geoplugin.net and return (lat, lon, location_name)
     try:
-        response = requests.get("http://www.geoplugin.net/json.gp", timeout=10)
+        response = requests.get(url or GEOPLUGIN_URL, timeout=LOCATION_LOOKUP_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         lat_str = data.get("geoplugin_latitude", None)
@@ -49,16 +64,30 @@ def get_geoplugin_location():
         logging.error(f"Failed to get location from geoplugin.net: {e}")
     return None, None, None
 
-def detect_location():
-    # Try ipinfo.io first, then geoplugin.net; return (lat, lon, location_name)
-    lat, lon, loc_name = get_ipinfo_location()
-    if lat is not None and lon is not None:
-        logging.info(f"Location from ipinfo.io: {lat}, {lon}, {loc_name}")
-        return lat, lon, loc_name
-    lat, lon, loc_name = get_geoplugin_location()
-    if lat is not None and lon is not None:
-        logging.info(f"Location from geoplugin.net: {lat}, {lon}, {loc_name}")
-        return lat, lon, loc_name
+LOCATION_PROVIDERS = [
+    ("ipinfo.io", get_ipinfo_location),
+    ("geoplugin.net", get_geoplugin_location),
+]
+
+def query_location_providers(providers=None, timeout=LOCATION_LOOKUP_TIMEOUT):
+    # Query all providers in parallel and return the first good (lat, lon, location_name).
+    providers = providers or LOCATION_PROVIDERS
+    executor = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="geolocate")
+    futures = {executor.submit(lookup): name for name, lookup in providers}
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            lat, lon, loc_name = future.result()
+            if lat is not None and lon is not None:
+                logging.info(f"Location from {futures[future]}: {lat}, {lon}, {loc_name}")
+                return lat, lon, loc_name
+    except FutureTimeoutError:
+        logging.error(f"No location provider answered within {timeout}s.")
+    finally:
+        # Don't wait for the slower providers; their requests end on their own timeout.
+        executor.shutdown(wait=False)
+    return None, None, None
+
+def get_fallback_location():
     if FALLBACK_LAT and FALLBACK_LON:
         try:
             lat = float(FALLBACK_LAT)
@@ -68,54 +97,287 @@ def detect_location():
             return lat, lon, loc_name
         except ValueError:
             logging.error("Invalid fallback coordinates; check FALLBACK_LAT and FALLBACK_LON.")
-    logging.warning("All location methods failed. Returning (None, None, 'Unknown').")
     return None, None, "Unknown"
 
-def get_weather_data(lat, lon):
-    # Fetch current weather data from Open-Meteo API and return a tuple.
+def detect_location():
+    # Query ipinfo.io and geoplugin.net in parallel, then fall back to FALLBACK_LAT/LON.
+    lat, lon, loc_name = query_location_providers()
+    if lat is not None and lon is not None:
+        return lat, lon, loc_name
+    lat, lon, loc_name = get_fallback_location()
+    if lat is None:
+        logging.warning("All location methods failed. Returning (None, None, 'Unknown').")
+    return lat, lon, loc_name
+
+class LocationResolver(threading.Thread):
+    """
+    Keeps the device location in LOCATION_CACHE_FILE so startup never waits on the network.
+    current() answers immediately from the cache (even an expired one), or from the
+    fallback coordinates. The thread refreshes the cache once it is older than
+    LOCATION_CACHE_TTL, and notifies subscribers when a lookup succeeds.
+    """
+
+    def __init__(self, cache_file=LOCATION_CACHE_FILE, ttl=LOCATION_CACHE_TTL,
+                 retry_interval=LOCATION_RETRY_INTERVAL, lookup=None):
+        super().__init__(name="location-resolver", daemon=True)
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.lookup = lookup or query_location_providers
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.listeners = []
+        self.location = None
+        self.resolved_at = None
+        self.load_cache()
+
+    def load_cache(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                cached = json.load(f)
+            self.location = (float(cached["lat"]), float(cached["lon"]), cached["name"])
+            self.resolved_at = float(cached["resolved_at"])
+            logging.info(f"Loaded cached location {self.location} from {self.cache_file}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Error loading location cache: {e}")
+
+    def save_cache(self):
+        tmp = self.cache_file + ".tmp"
+        lat, lon, name = self.location
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"lat": lat, "lon": lon, "name": name, "resolved_at": self.resolved_at}, f)
+            os.replace(tmp, self.cache_file)
+        except Exception as e:
+            logging.error(f"Error saving location cache: {e}")
+
+    def current(self):
+        with self.lock:
+            location = self.location
+        return location if location else get_fallback_location()
+
+    def subscribe(self, callback):
+        # callback(lat, lon, location_name) runs on the resolver thread after each successful lookup.
+        self.listeners.append(callback)
+
+    def expires_in(self):
+        with self.lock:
+            resolved_at = self.resolved_at
+        if resolved_at is None:
+            return 0
+        return max(0.0, resolved_at + self.ttl - time.time())
+
+    def resolve(self):
+        lat, lon, loc_name = self.lookup()
+        if lat is None or lon is None:
+            return False
+        with self.lock:
+            self.location = (lat, lon, loc_name)
+            self.resolved_at = time.time()
+        self.save_cache()
+        for callback in self.listeners:
+            try:
+                callback(lat, lon, loc_name)
+            except Exception as e:
+                logging.error(f"Location listener failed: {e}")
+        return True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            delay = self.expires_in()
+            if delay <= 0:
+                delay = self.ttl if self.resolve() else self.retry_interval
+            self.stop_event.wait(delay)
+
+    def stop(self):
+        self.stop_event.set()
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+FORECAST_FIELDS = ("temperature_2m", "relativehumidity_2m", "shortwave_radiation", "windspeed_10m")
+
+class WeatherForecast:
+    """
+    A bounded window of hourly forecast values kept as compact float arrays.
+    at(ts) linearly interpolates (temp, humidity, sunlight, wind_speed) for any
+    timestamp inside the window, so each reading gets weather for its own time.
+    """
+
+    def __init__(self, times, columns):
+        # times: epoch seconds, ascending; columns: one sequence per FORECAST_FIELDS entry.
+        self.times = array("d", times)
+        self.columns = [array("d", (math.nan if v is None else v for v in col)) for col in columns]
+
+    @classmethod
+    def from_open_meteo(cls, data):
+        hourly = data.get("hourly", {})
+        times = hourly.get("time", [])
+        columns = [hourly.get(field) or [None] * len(times) for field in FORECAST_FIELDS]
+        if not times or any(len(col) != len(times) for col in columns):
+            raise ValueError("Incomplete hourly forecast in Open-Meteo response")
+        return cls(times, columns)
+
+    @classmethod
+    def from_dict(cls, cached):
+        return cls(cached["times"], [[None if v is None else v for v in col] for col in cached["columns"]])
+
+    def to_dict(self):
+        return {
+            "times": list(self.times),
+            "columns": [[None if math.isnan(v) else v for v in col] for col in self.columns],
+        }
+
+    def covers(self, ts):
+        return bool(self.times) and self.times[0] <= ts <= self.times[-1]
+
+    def at(self, ts):
+        if not self.covers(ts):
+            return None, None, None, None
+        i = bisect.bisect_right(self.times, ts)
+        if i >= len(self.times):
+            i = len(self.times) - 1
+        lo = max(0, i - 1)
+        t0, t1 = self.times[lo], self.times[i]
+        frac = 0.0 if t1 == t0 else (ts - t0) / (t1 - t0)
+        values = []
+        for col in self.columns:
+            v0, v1 = col[lo], col[i]
+            if math.isnan(v0) or math.isnan(v1):
+                values.append(None)
+            else:
+                values.append(round(v0 + (v1 - v0) * frac, 2))
+        return tuple(values)
+
+def get_weather_forecast(lat, lon):
+    # Fetch a WEATHER_PAST_HOURS..WEATHER_FORECAST_HOURS hourly window from Open-Meteo.
     if lat is None or lon is None:
         logging.warning("Latitude/Longitude not available. Cannot fetch weather data.")
-        return None, None, None, None
+        return None
     try:
-        url = "https://api.open-meteo.com/v1/forecast"
         params = {
             "latitude": lat,
             "longitude": lon,
-            "current_weather": "true",
-            "hourly": "relativehumidity_2m,shortwave_radiation",
-            "timezone": "auto"
+            "hourly": ",".join(FORECAST_FIELDS),
+            "past_hours": WEATHER_PAST_HOURS,
+            "forecast_hours": WEATHER_FORECAST_HOURS,
+            "timeformat": "unixtime",
         }
-        response = requests.get(url, params=params, timeout=10)
+        response = requests.get(OPEN_METEO_URL, params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
-        current = data.get("current_weather", {})
-        weather_temp = current.get("temperature")
-        weather_wind_speed = current.get("windspeed")
-        current_time = current.get("time")
-        weather_humidity = None
-        weather_sunlight = None
-        hourly = data.get("hourly", {})
-        hourly_time = hourly.get("time", [])
-        hourly_humidity = hourly.get("relativehumidity_2m", [])
-        hourly_radiation = hourly.get("shortwave_radiation", [])
-        if current_time and hourly_time:
-            try:
-                index = hourly_time.index(current_time)
-                if index < len(hourly_humidity):
-                    weather_humidity = hourly_humidity[index]
-                if index < len(hourly_radiation):
-                    weather_sunlight = hourly_radiation[index]
-            except ValueError:
-                if hourly_humidity:
-                    weather_humidity = hourly_humidity[0]
-                if hourly_radiation:
-                    weather_sunlight = hourly_radiation[0]
-        else:
-            if hourly_humidity:
-                weather_humidity = hourly_humidity[0]
-            if hourly_radiation:
-                weather_sunlight = hourly_radiation[0]
-        return weather_temp, weather_humidity, weather_sunlight, weather_wind_speed
+        return WeatherForecast.from_open_meteo(response.json())
     except Exception as e:
         logging.error(f"Failed to retrieve weather data: {e}")
+        return None
+
+def get_weather_data(lat, lon):
+    # Fetch weather for the current time and return (temp, humidity, sunlight, wind_speed).
+    forecast = get_weather_forecast(lat, lon)
+    if forecast is None:
         return None, None, None, None
+    return forecast.at(time.time())
+
+class WeatherRefresher(threading.Thread):
+    """
+    Fetches weather in a background thread so a slow or dead uplink never stalls sampling.
+    The latest forecast window is kept in memory with its fetch time and persisted to
+    WEATHER_CACHE_FILE, so a restart picks up where it left off. The sampler only
+    reads the cache through latest(), which interpolates for the reading's time.
+    """
+
+    EMPTY = (None, None, None, None)
+
+    def __init__(self, lat, lon, cache_file=WEATHER_CACHE_FILE, interval=WEATHER_FETCH_INTERVAL,
+                 retry_interval=WEATHER_RETRY_INTERVAL, ttl=WEATHER_CACHE_TTL, fetch=None):
+        super().__init__(name="weather-refresher", daemon=True)
+        self.lat = lat
+        self.lon = lon
+        self.cache_file = cache_file
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.ttl = ttl
+        self.fetch = fetch or get_weather_forecast
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.location_changed = False
+        self.forecast = None
+        self.fetched_at = None  # Wall-clock time of the last successful fetch
+        self.load_cache()
+
+    def load_cache(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                cached = json.load(f)
+            self.forecast = WeatherForecast.from_dict(cached["forecast"])
+            self.fetched_at = float(cached["fetched_at"])
+            logging.info(f"Loaded cached weather from {self.cache_file}, age {self.age():.0f}s")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Error loading weather cache: {e}")
+
+    def save_cache(self):
+        # Write to a temp file and rename, so a power cut never leaves a torn cache.
+        tmp = self.cache_file + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"forecast": self.forecast.to_dict(), "fetched_at": self.fetched_at}, f)
+            os.replace(tmp, self.cache_file)
+        except Exception as e:
+            logging.error(f"Error saving weather cache: {e}")
+
+    def age(self):
+        # Seconds since the cached weather was fetched, or None if nothing was ever fetched.
+        with self.lock:
+            fetched_at = self.fetched_at
+        return None if fetched_at is None else max(0.0, time.time() - fetched_at)
+
+    def latest(self, ts=None):
+        """
+        Return ((temp, humidity, sunlight, wind_speed), fetched_str) for time ts (default now).
+        Expired data, or a ts outside the forecast window, comes back as Nones with
+        fetched_str "Unknown".
+        """
+        ts = time.time() if ts is None else ts
+        with self.lock:
+            forecast, fetched_at = self.forecast, self.fetched_at
+        if forecast is None or ts - fetched_at > self.ttl or not forecast.covers(ts):
+            return self.EMPTY, "Unknown"
+        return forecast.at(ts), datetime.fromtimestamp(fetched_at).strftime('%Y-%m-%d %H:%M:%S')
+
+    def set_location(self, lat, lon):
+        # Point the refresher at new coordinates and fetch for them right away.
+        with self.lock:
+            if (lat, lon) == (self.lat, self.lon):
+                return
+            self.lat, self.lon = lat, lon
+            self.location_changed = True
+        self.wake_event.set()
+
+    def refresh(self):
+        with self.lock:
+            lat, lon = self.lat, self.lon
+            self.location_changed = False
+        forecast = self.fetch(lat, lon)
+        if forecast is not None:
+            with self.lock:
+                self.forecast = forecast
+                self.fetched_at = time.time()
+            self.save_cache()
+            return True
+        return False
+
+    def run(self):
+        while not self.stop_event.is_set():
+            age = self.age()
+            if age is None or age >= self.interval or self.location_changed:
+                delay = self.interval if self.refresh() else self.retry_interval
+            else:
+                delay = self.interval - age
+            self.wake_event.wait(delay)
+            self.wake_event.clear()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
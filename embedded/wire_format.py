@@ -0,0 +1,78 @@
+from datetime import datetime
+
+try:
+    import msgpack
+except ImportError:  # Optional: without it batches go out as JSON
+    msgpack = None
+
+# Columnar batch encoding for /api/send-data, sent as COLUMNAR_CONTENT_TYPE.
+# A msgpack map {"v": 1, "n": rows, <column>: <encoded column>, ...} where a column is:
+#   [v, v, ...]                       plain values
+#   {"delta": [first, d1, d2, ...]}   integers, each stored as the difference to the previous
+#   {"base": "YYYY-mm-dd HH:MM:SS", "delta": [...]}  timestamps as second deltas from base
+#   {"scale": 100, "v": [...]}        fixed-point numbers, value = v / scale
+#   {"dict": [s0, s1, ...], "idx": [...]}  repeated strings as indexes into dict
+# backend/schemas/columnar_batch.py decodes the same layout.
+COLUMNAR_CONTENT_TYPE = "application/x-msgpack"
+FORMAT_VERSION = 1
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+FIXED_POINT_SCALE = 100
+
+INT_COLUMNS = ("sensor_id", "adc_value")
+NUMBER_COLUMNS = ("moisture_level", "weather_temp", "weather_humidity", "weather_sunlight", "weather_wind_speed")
+STRING_COLUMNS = ("digital_status", "location", "weather_fetched", "device_id")
+
+def available():
+    return msgpack is not None
+
+def deltas(values):
+    out, prev = [], 0
+    for v in values:
+        out.append(v - prev)
+        prev = v
+    return out
+
+def encode_numbers(values):
+    # Fixed point when every value has at most two decimals (all stored readings are
+    # rounded to two); plain values otherwise so nothing is lost.
+    scaled = [round(v * FIXED_POINT_SCALE) for v in values]
+    if all(s / FIXED_POINT_SCALE == v for s, v in zip(scaled, values)):
+        return {"scale": FIXED_POINT_SCALE, "v": scaled}
+    return list(values)
+
+def encode_ints(values):
+    if all(float(v).is_integer() for v in values):
+        return [int(v) for v in values]
+    return list(values)
+
+def encode_strings(values):
+    index = {}
+    idx = [index.setdefault(v, len(index)) for v in values]
+    return {"dict": list(index), "idx": idx}
+
+def encode_columnar(data):
+    """
+    Encode a batch of uplink.row_to_dict() rows. Returns None when the batch cannot be
+    represented (msgpack missing, unparseable timestamp), in which case send JSON.
+    """
+    if msgpack is None or not data:
+        return None
+    try:
+        stamps = [datetime.strptime(row["timestamp"], TIMESTAMP_FORMAT) for row in data]
+    except (TypeError, ValueError):
+        return None
+    base = stamps[0]
+    seconds = [int((ts - base).total_seconds()) for ts in stamps]
+    batch = {
+        "v": FORMAT_VERSION,
+        "n": len(data),
+        "id": {"delta": deltas([row["id"] for row in data])},
+        "timestamp": {"base": base.strftime(TIMESTAMP_FORMAT), "delta": deltas(seconds)},
+    }
+    for name in INT_COLUMNS:
+        batch[name] = encode_ints([row[name] for row in data])
+    for name in NUMBER_COLUMNS:
+        batch[name] = encode_numbers([row[name] for row in data])
+    for name in STRING_COLUMNS:
+        batch[name] = encode_strings([row[name] for row in data])
+    return msgpack.packb(batch, use_bin_type=True)